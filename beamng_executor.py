@@ -1,78 +1,123 @@
 import imp
 import time
 import beamngpy
-from beamngpy import BeamNGpy, Scenario, Vehicle
 from beamng_test_case import BeamNGTestCase
+from beamng_session import BeamNGSession
+from executor import Executor
+from trajectory import TrajectoryColumn
+import profiling
 from pathlib import Path
-import shapely
 import numpy as np
 import traceback
-from abc import ABC, abstractmethod
 
-class Executor(ABC):
+class TickDeadlines:
+    '''
+        Latency of ticks in wall clock mode, time from when a tick was due
+        to when it was processed. Latency over the interval misses the next
+        tick deadline and whole intervals are skipped.
+    '''
+
+    #bucket edges as fractions of the interval
+    EDGES = [0, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 4]
+
+    def __init__(self, interval: float, capacity: int) -> None:
+        self.interval = interval
+        self.latency = TrajectoryColumn(np.float32, capacity=capacity)
+        self.missed_deadlines = 0
+        self.skipped_intervals = 0
+
+    def record(self, latency: float) -> int:
+        '''Returns the number of intervals to skip'''
+        self.latency.append(latency)
+        skipped = int(latency // self.interval)
+        if skipped:
+            self.missed_deadlines += 1
+            self.skipped_intervals += skipped
+        return skipped
+
+    def summary(self) -> dict:
+        latency = self.latency.array / self.interval
+        edges = self.EDGES + [np.inf]
+        histogram, _ = np.histogram(latency, bins=edges)
+        return {
+            'mode': "wall_clock",
+            'ticks': len(latency),
+            'histogram_edges': self.EDGES, #fractions of interval, last bucket is open
+            'histogram': histogram.tolist(),
+            'mean_latency': float(latency.mean() * self.interval) if len(latency) else 0.0,
+            'max_latency': float(latency.max() * self.interval) if len(latency) else 0.0,
+            'missed_deadlines': self.missed_deadlines,
+            'skipped_intervals': self.skipped_intervals,
+        }
 
-    TIME_BUDGET = 60 #60secs
-    GOAL_DISTANCE_THRESHOLD = 8 #if car is 8 meters from goal, the goal is reached
-
-    @abstractmethod
-    def _load(self):
-        raise "Not Implemented"
-    
-    @abstractmethod
-    def _run(self):
-        raise "Not Implemented"
-    
-    def execute(self):
-        self._load()
-        self._run()
 
 class BeamNGExecutor(Executor):
-
-    def __init__(self, beamng_home: Path, beamng_user: Path, results_dir: Path, test_case: BeamNGTestCase, ai_on=True) -> None:
-
+    '''
+        Runs a test case in BeamNG.tech.
+        By default the simulator runs in real time and the vehicle is read every
+        interval of wall clock time, late ticks are recorded in execution_data['tick_timing'].
+        With stepped=True the simulator is deterministic and paused, every tick
+        advances it by exactly interval * steps_per_second physics steps,
+        so runs are reproducible and not limited to real time.
+    '''
+
+    STEPS_PER_SECOND = 60
+
+    def __init__(self, beamng_home: Path, beamng_user: Path, results_dir: Path, test_case: BeamNGTestCase, ai_on=True,
+                 record_only=False, session: BeamNGSession = None, verbose=False, stepped=False,
+                 steps_per_second=STEPS_PER_SECOND, oracles: list = None) -> None:
+
+        super().__init__(results_dir, test_case, ai_on=ai_on, record_only=record_only, verbose=verbose,
+                         oracles=oracles)
         beamngpy.logging.basicConfig(filename="beamng.log")
         self.beamng_home = beamng_home
         self.beamng_user = beamng_user
-        self.results_dir = results_dir
-        self.test_case = test_case
-        self.ai_on = ai_on
-        self.end = False
-        
-
-    def _load(self):
-        self.test_case.write_road_to_level()
-         # Instantiate BeamNGpy instance running the simulator from the given path,
-        # communicating over localhost:64256
-        self.bng = BeamNGpy('localhost', 64256, home=self.beamng_home, user=self.beamng_user)
-        # Launch BeamNG.tech
-        self.bng.open(launch=True)
-        
-        self.vehicle = Vehicle('car', model='etk800', licence='OSM Testing', color='Blue')
-
-
-        # Create a scenario in smallgrid called 'osm_testing'
-        self.scenario = Scenario('smallgrid', 'osm_testing')
-
 
-        # Add it to our scenario at this position and rotation
-        pos, rot = self.test_case.vehicle_start_pose()
+        self.stepped = stepped
+        self.steps_per_second = steps_per_second
+        self.steps_per_tick = max(1, int(round(test_case.interval * steps_per_second)))
+        self.deadlines = TickDeadlines(test_case.interval, int(np.ceil(self.TIME_BUDGET / test_case.interval)) + 1)
 
-        self.scenario.add_vehicle(self.vehicle, pos=pos, rot=rot)
-        # Place files defining our scenario for the simulator to read
-        self.scenario.make(self.bng)
+        #without shared session, simulator is launched and closed for this test only
+        self.owns_session = session is None
+        if session is None:
+            session = BeamNGSession(beamng_home, beamng_user)
+        self.session = session
 
-        self.bng.load_scenario(self.scenario) 
+    def _load(self):
+        # Launch BeamNG.tech, or reuse the one already running in the session
+        with profiling.span("launch"):
+            launch_time = self.session.ensure_open()
+        self.bng = self.session.bng
+
+        reload_start = time.time()
+        #level file is written only if the road changed, scenario files are made once per simulator
+        builder = self.session.scenario_builder
+        level_digest = builder.write_level(self.test_case)
+        with profiling.span("load_scenario"):
+            self.scenario, self.vehicle = builder.load(self.bng, self.test_case, level_digest)
+
+        if self.stepped:
+            self.bng.set_deterministic()
+            self.bng.set_steps_per_second(self.steps_per_second)
 
         if self.ai_on:
             self.vehicle_ai_setup()
 
+        reload_time = time.time() - reload_start
+        self.session.record_reload(reload_time)
+        self.test_case.execution_data['timings'] = {
+            'launch': launch_time,
+            'reload': reload_time,
+        }
+
     def vehicle_ai_setup(self):
         # self.vehicle.ai_set_aggression(self.test_case.risk)
         self.vehicle.ai_set_speed(self.test_case.max_speed, mode='limit')
         self.vehicle.ai_drive_in_lane(True)
         self.vehicle.ai_set_waypoint(self.test_case.waypoint_name)
 
-    def _car_surface(self) -> shapely.Polygon:
+    def _car_footprint(self) -> np.ndarray:
         car_box = self.vehicle.get_bbox()
         surface_points = [
             car_box['front_bottom_left'],
@@ -80,96 +125,60 @@ class BeamNGExecutor(Executor):
             car_box['rear_bottom_right'],
             car_box['rear_bottom_left'],
         ]
-        p = shapely.Polygon(surface_points)
-        return p
-
-    def _oob_ratio(self):
-        car = self._car_surface()
-        
-        lane = self.test_case.road.right_lane_polygon
-        diffrence = car.difference(lane)
-        oob = diffrence.area/car.area
-        # if oob > 0:
-        #     from matplotlib import pyplot as plt
-        #     plt.plot(
-        #         *car.exterior.xy, "b-",
-        #         *lane.exterior.xy, "ro--",
-        #         *diffrence.exterior.xy, "g--",
-        #         )
-        
-        #     plt.show()
-        #     input("Pres enter")
-        return oob
-
-    def _distance_to_goal(self):
-        car = self._car_surface()
-        goal = shapely.Point(self.test_case.waypoint_position)
-        return car.distance(goal)
-    
-    def _has_no_time(self):
-        now = time.time()
-        elapsed = now-self.start_time
-        return elapsed >= self.TIME_BUDGET
-    
-    def _goal_reached(self):
-        d = self._distance_to_goal()
-        return d < self.GOAL_DISTANCE_THRESHOLD
-    
-    def _check_end_conditions(self):
-        if self._has_no_time():
-            self.end = True
-            self.test_case.execution_data['finish'] = "Out of time"
-            self.test_case.execution_data['success'] = False
-            print("Out of time, closing")
-
-        if self._goal_reached():
-            self.end = True
-            self.test_case.execution_data['finish'] = "Goal Reached"
-            self.test_case.execution_data['success'] = True
-            print("Goal reached successfully quiting")
-
-    def _read_execution_data(self):
-        oob = self._oob_ratio()
-        self.test_case.execution_data['out_of_bounds'].append(oob)
-        msg = f"Oob: {oob:.2f}"
+        return np.array(surface_points)
 
+    def _vehicle_state(self):
         self.vehicle.poll_sensors()
-        if self.vehicle.state:
-            pos = self.vehicle.state.get('pos')
-            self.test_case.execution_data['position'].append(pos)
-
-            vel = self.vehicle.state.get('vel')
-            self.test_case.execution_data['velocity'].append(vel)
-
-            msg += f", Position: {np.around(pos, 2)}, Velocity: {np.linalg.norm(vel):.2f} m/s"
+        if not self.vehicle.state:
+            return None
+        return self.vehicle.state.get('pos'), self.vehicle.state.get('vel')
 
-        print(msg)
-
-    def _tick(self):
-        try:
-            self._read_execution_data()
-            self._check_end_conditions()
-        except Exception as e:
-            self.end = True
-            self.test_case.execution_data['finish'] = f"Exception {e}"
-            self.test_case.execution_data['success'] = False
-            print(e.__repr__())
-
-    def _run(self):
+    def _start(self):
         #masks some stupid beamngy error
         try:
             self.scenario.start()
         except TypeError:
             pass
 
+        if self.stepped:
+            self.bng.pause()
+        self.sim_time = 0.0
+        self.next_tick = 0 #index of the interval the next tick is due at, wall clock mode
         self.start_time = time.time()
-        while not self.end:
-            self._tick()
-
-            #tick every interval
-            inter = self.test_case.interval
-            time.sleep(inter - ((time.time() - self.start_time) % inter))
-
-        self.test_case.save_execution_data(self.results_dir)
-        self.bng.close()
 
+    def _elapsed(self) -> float:
+        if self.stepped:
+            return self.sim_time
+        return time.time() - self.start_time
+
+    def _wait_for_next_tick(self):
+        if self.stepped:
+            self.bng.step(self.steps_per_tick, wait=True)
+            self.sim_time += self.steps_per_tick / self.steps_per_second
+            return
+
+        #tick every interval, a late tick skips the intervals it overran
+        inter = self.test_case.interval
+        due = self.start_time + self.next_tick * inter
+        skipped = self.deadlines.record(time.time() - due)
+        self.next_tick += 1 + skipped
+        time.sleep(max(0.0, self.start_time + self.next_tick * inter - time.time()))
+
+    def _tick_timing(self) -> dict:
+        if not self.stepped:
+            return self.deadlines.summary()
+
+        wall_time = time.time() - self.start_time
+        return {
+            'mode': "stepped",
+            'ticks': self.n_ticks,
+            'steps_per_second': self.steps_per_second,
+            'steps_per_tick': self.steps_per_tick,
+            'simulated_time': self.sim_time,
+            'wall_time': wall_time,
+            'real_time_factor': self.sim_time / wall_time if wall_time > 0 else 0.0,
+        }
+
+    def _close(self):
+        if self.owns_session:
+            self.session.close()
@@ -0,0 +1,98 @@
+import time
+from pathlib import Path
+from beamngpy import BeamNGpy
+from scenario_builder import ScenarioBuilder
+
+
+class BeamNGSession:
+    '''
+        Long lived simulator session shared by many test cases.
+        The simulator is launched once, and relaunched only when its process died,
+        between tests only the road and the scenario are reloaded.
+    '''
+
+    def __init__(self, beamng_home: Path, beamng_user: Path, host='localhost', port=64256,
+                 bng_factory=BeamNGpy) -> None:
+        self.beamng_home = beamng_home
+        self.beamng_user = beamng_user
+        self.host = host
+        self.port = port
+        self.bng_factory = bng_factory #anything with BeamNGpy interface, e.g. fake endpoint
+
+        self.bng = None
+        self.scenario_builder = ScenarioBuilder() #scenario and level file reused between tests
+        self.launch_times = []
+        self.reload_times = []
+
+    @property
+    def road_file_path(self) -> Path:
+        '''Level file the roads are written to, inside this session's user directory'''
+        return Path(self.beamng_user) / 'levels' / "smallgrid" / 'main' / 'MissionGroup' / 'Roads' / 'items.level.json'
+
+    @property
+    def is_open(self):
+        return self.bng is not None
+
+    def is_alive(self) -> bool:
+        if self.bng is None:
+            return False
+
+        process = getattr(self.bng, 'process', None)
+        if process is not None and process.poll() is not None:
+            return False
+
+        try:
+            self.bng.get_gamestate()
+        except Exception:
+            return False
+        return True
+
+    def open(self):
+        start = time.time()
+        self.bng = self.bng_factory(self.host, self.port, home=self.beamng_home, user=self.beamng_user)
+        self.bng.open(launch=True)
+        self.launch_times.append(time.time() - start)
+
+    def ensure_open(self) -> float:
+        '''Launches simulator if needed, returns time spent on launching'''
+        if self.is_alive():
+            return 0.0
+
+        if self.bng is not None:
+            print("Simulator not responding, relaunching")
+            self.close()
+
+        self.open()
+        return self.launch_times[-1]
+
+    def record_reload(self, seconds: float):
+        self.reload_times.append(seconds)
+
+    def close(self):
+        if self.bng is None:
+            return
+        try:
+            self.bng.close()
+        except Exception:
+            #process already dead
+            pass
+        self.bng = None
+
+    def stats(self) -> dict:
+        return {
+            'launches': len(self.launch_times),
+            'launch_time': sum(self.launch_times),
+            'reloads': len(self.reload_times),
+            'mean_reload_time': sum(self.reload_times) / len(self.reload_times) if self.reload_times else 0.0,
+            **self.scenario_builder.stats(),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
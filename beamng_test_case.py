@@ -1,10 +1,12 @@
 from roads import Road
+import hashlib
 import uuid
 import numpy as np
-import json
+import fast_json
 from pathlib import Path
-import os
 from abc import ABC, abstractmethod
+from profiling import Profile
+from trajectory import TrajectoryColumn, trajectory_columns, unique_execution_path, write_execution_data
 
 class TestCase(ABC):
     HARD_SHOULDER_WIDTH = 1 #meter, in the UK for non-motorway roads
@@ -30,7 +32,9 @@ class TestCase(ABC):
         self.execution_data['name'] = self.road.name
         self.execution_data['length'] = self.road.line_string.length
         self.execution_data['n_points'] = self.road.n_points
-        self.execution_data['points'] = self.road.points.tolist()
+        self.execution_data['nodes_saved'] = self.road.nodes_saved #by adaptive resampling
+        self.execution_data['points'] = self.road.points
+        self.execution_data['road_width'] = self.road.width
 
         
         self.execution_data['tick_interval'] = self.interval
@@ -39,22 +43,26 @@ class TestCase(ABC):
 
         #filled by executor
         self.execution_data['finish'] = "Not finished"
-        self.execution_data['out_of_bounds'] = []
-        self.execution_data['position'] = []
-        self.execution_data['velocity'] = []
         self.execution_data['success'] = False
+        #out_of_bounds, bbox (raw car footprints, for computing metrics after the run), position, velocity
+        self.execution_data.update(trajectory_columns())
 
-    def save_execution_data(self, dir: Path):
+    def reserve_trajectory(self, n_ticks: int):
+        '''Preallocates per tick series for the expected number of ticks'''
+        for column in self.execution_data.values():
+            if isinstance(column, TrajectoryColumn):
+                column.reserve(n_ticks)
 
-        #find unique name
-        target_path = dir / f"{self.road.name}.json"
-        counter = 0
-        while os.path.exists(target_path):
-            target_path = dir / f"{self.road.name}({counter}).json"
-            counter += 1
+    def reset_execution_data(self):
+        '''Drops data of a previous (e.g. crashed) execution'''
+        self.execution_data = {}
+        self._init_execution_data()
 
-        with open(target_path, 'w') as f:
-            json.dump(self.execution_data, f)
+    def save_execution_data(self, dir: Path) -> Path:
+        '''Writes json header and binary trajectory, returns path of the header'''
+        target_path = unique_execution_path(dir, self.road.name)
+        write_execution_data(target_path, self.execution_data)
+        return target_path
 
     
 class BeamNGTestCase(TestCase):
@@ -68,13 +76,34 @@ class BeamNGTestCase(TestCase):
         self.interval = interval
         self.risk = risk
         self.max_speed = max_speed
+        #preparing the road, then phases of executions, saved with execution data
+        self.profile = Profile()
+        self.profile.merge(r.profile.snapshot())
         self.execution_data = {}
         self._init_execution_data()
 
         if visualise:
             self.road._show()
+
+    def _init_execution_data(self):
+        super()._init_execution_data()
+        self.execution_data['waypoint_position'] = self.waypoint_position
     
 
+    def _road_digest(self) -> str:
+        '''Hash of the road geometry, cached until road points are replaced'''
+        cache = getattr(self, '_digest_cache', None)
+        if cache is None or cache[0] is not self.road.points or cache[1] != self.road.width:
+            h = hashlib.sha1(np.ascontiguousarray(self.road.points, dtype=np.float64).tobytes())
+            h.update(str(self.road.width).encode("utf-8"))
+            cache = (self.road.points, self.road.width, h.hexdigest())
+            self._digest_cache = cache
+        return cache[2]
+
+    def _persistent_id(self, kind: str) -> str:
+        '''Same road gives the same ids, so its level file is byte for byte the same'''
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{kind}:{self._road_digest()}"))
+
     @property
     def decal_road_json(self):
 
@@ -82,13 +111,13 @@ class BeamNGTestCase(TestCase):
         nodes = np.column_stack((self.road.points, road_width_column))
 
         return {"class": "DecalRoad",
-            "persistentId": str(uuid.uuid4()), 
+            "persistentId": self._persistent_id("DecalRoad"), 
             "__parent": "Roads", 
             "position": [0, 0, 0], 
             "Material": "tig_road_rubber_sticky", 
             "drivability": 1, 
             "improvedSpline": True, 
-            "nodes": nodes.tolist(), 
+            "nodes": nodes, #serialized straight from the array, see fast_json
             "order_simset": 7, 
             "overObjects": True
         }
@@ -105,10 +134,10 @@ class BeamNGTestCase(TestCase):
         return {
             "name": "NewMeshRoad",
             "class": "MeshRoad",
-            "persistentId": str(uuid.uuid4()),
+            "persistentId": self._persistent_id("MeshRoad"),
             "__parent": "Roads",
             "bottomMaterial": "track_editor_grid",
-            "nodes": nodes.tolist(), 
+            "nodes": nodes, 
             "order_simset": 8,
             "sideMaterial": "track_editor_grid", 
             "topMaterial": "track_editor_grid"
@@ -117,46 +146,43 @@ class BeamNGTestCase(TestCase):
     @property
     def waypoint_position(self) -> list:
         #x,y,z
-        second_to_last = self.road.points[-2]
-        last_point = self.road.points[-1]
-        dir = last_point-second_to_last
-        _, r = self.road._calculate_left_and_right_edge_point(
-            last_point, last_point+dir
-        )
-        ret = (last_point+r) / 2
-        return ret.tolist()
+        #middle of the right lane, in the direction of the last segment
+        last_point = np.copy(self.road.points[-1])
+        last_point[0:2] += self.road.edge_normals[-1] / 2
+        return last_point.tolist()
     @property
     def waypoint_json(self):
 
         return {
         'name': self.waypoint_name,
         'class': 'BeamNGWaypoint',
-        'persistentId': str(uuid.uuid4()),
+        'persistentId': self._persistent_id("BeamNGWaypoint"),
         '__parent': 'Roads',
         'position': self.waypoint_position,
         'scale': [self.road.width]*3, #x y z size
         }
 
-    @classmethod
-    def write_json(cls, json_data, file_handler):
-        json.dump(json_data, file_handler) #dump json in one line
-        file_handler.write("\n") #go to new line
-
-    def write_road_to_level(self):
-        with open(self.file_path, 'w') as f:
-            self.write_json(self.decal_road_json, f)
-            self.write_json(self.mesh_road_json, f)
-            self.write_json(self.waypoint_json, f)
-
-        print(f"Road written to: \n {self.file_path}")
+    @property
+    def level_file_content(self) -> bytes:
+        '''Road, mesh road and waypoint objects, one json per line, cached until road points change'''
+        cache = getattr(self, '_level_cache', None)
+        if cache is None or cache[0] != self._road_digest():
+            objects = (self.decal_road_json, self.mesh_road_json, self.waypoint_json)
+            content = b"".join(fast_json.dumps(o) + b"\n" for o in objects)
+            cache = (self._road_digest(), content)
+            self._level_cache = cache
+        return cache[1]
+
+    def prepare_level_file(self):
+        '''Serializes the level file ahead of the run, e.g. in a background thread'''
+        self.level_file_content
 
     def vehicle_start_pose(self, meters_from_road_start=3.5):
 
         p1 = self.road.points[0]
         p2 = self.road.points[1]
 
-        _, p1r = self.road._calculate_left_and_right_edge_point(p1, p2)
-        p1r = p1r[0:2]
+        p1r = self.road.right_edge[0, 0:2]
 
         direction = np.subtract(p2[0:2], p1[0:2])
         v = (direction / np.linalg.norm(direction)) * meters_from_road_start
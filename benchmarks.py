@@ -0,0 +1,196 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import shapely
+from roads import Road
+from beamng_test_case import BeamNGTestCase
+from oob import OOBEngine
+
+#benchmarks of the geometry and metric hot paths, offline, no simulator
+ROAD_SIZES = [10, 100, 1000, 10000] #points before interpolation
+TICKS = 600 #footprints of a 60 s run with 0.1 s interval
+SEGMENT_LENGTH = 5.0 #meters between synthetic road points
+REPEAT = 5
+MIN_MEASUREMENT = 0.1 #seconds, fast stages are called in a loop for at least this long
+MAX_SECONDS_PER_STAGE = 10 #fewer repeats for the big roads
+CAR_LENGTH = 4.9
+CAR_WIDTH = 1.9
+
+
+def synthetic_road_points(n_points: int) -> np.ndarray:
+    '''Gently winding, never self intersecting road with some elevation'''
+    x = np.arange(n_points) * SEGMENT_LENGTH
+    y = 30 * np.sin(x / 80) + 10 * np.sin(x / 23)
+    z = 1 + 5 * (1 + np.sin(x / 150))
+    return np.column_stack((x, y, z))
+
+
+def synthetic_footprints(road: Road, ticks=TICKS) -> np.ndarray:
+    '''(ticks, 4, 3) car footprints along the right lane, wobbling so some leave it'''
+    i = np.linspace(0, len(road.points) - 2, ticks).astype(int)
+    centre = road.points[i, 0:2]
+    direction = road.points[i + 1, 0:2] - centre
+    direction /= np.maximum(np.linalg.norm(direction, axis=1), 1e-9)[:, None]
+    left = np.column_stack((-direction[:, 1], direction[:, 0]))
+
+    wobble = road.width / 4 * (1 + 1.2 * np.sin(np.arange(ticks) / 15))
+    car = centre - left * wobble[:, None]
+    forward = direction * CAR_LENGTH / 2
+    side = left * CAR_WIDTH / 2
+    corners = np.stack((car + forward + side, car + forward - side, car - forward - side, car - forward + side), axis=1)
+    height = np.repeat(road.points[i, 2][:, None], 4, axis=1)[..., None]
+    return np.concatenate((corners, height), axis=2)
+
+
+def _measure(func, loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return time.perf_counter() - start
+
+
+def _time(func, repeat: int) -> float:
+    '''
+        Seconds of a call, best of repeat measurements,
+        the minimum is the least disturbed by the rest of the machine.
+    '''
+    #calibrate loops like timeit autorange
+    loops = 1
+    while True:
+        seconds = _measure(func, loops)
+        if seconds >= MIN_MEASUREMENT:
+            break
+        loops *= 10 if seconds < MIN_MEASUREMENT / 10 else 2
+
+    times = [seconds / loops]
+    deadline = time.perf_counter() + MAX_SECONDS_PER_STAGE
+    for _ in range(repeat - 1):
+        if time.perf_counter() > deadline:
+            break
+        times.append(_measure(func, loops) / loops)
+    return min(times)
+
+
+def _peak_memory(func) -> int:
+    '''Peak bytes allocated by the call, Python and NumPy, GEOS allocations are not seen'''
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def stages(n_points: int) -> dict:
+    '''name -> (function, number of items it processes, unit)'''
+    points = synthetic_road_points(n_points)
+    road = Road(points=points, name=f"synthetic_{n_points}")
+    test_case = BeamNGTestCase(road, Path("unused.json"))
+    engine = OOBEngine(road)
+    footprints = synthetic_footprints(road)
+
+    def is_valid():
+        #is_valid prints why a road is rejected, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            test_case.is_valid()
+
+    def level_file():
+        #uncached, as on the first write of a new road
+        test_case._level_cache = None
+        return test_case.level_file_content
+
+    def oob_per_tick():
+        for footprint in footprints:
+            engine.oob_ratio(footprint)
+
+    return {
+        'road_init': (lambda: Road(points=points.copy(), name="bench"), n_points, "points/s"),
+        'road_init_adaptive': (lambda: Road(points=points.copy(), name="bench", adaptive=True), n_points, "points/s"),
+        'decal_road_json': (lambda: test_case.decal_road_json, road.n_points, "points/s"),
+        'mesh_road_json': (lambda: test_case.mesh_road_json, road.n_points, "points/s"),
+        'level_file': (level_file, road.n_points, "points/s"),
+        'is_valid': (is_valid, road.n_points, "points/s"),
+        'oob_engine_init': (lambda: OOBEngine(road), road.n_points, "points/s"),
+        'oob_ratio': (oob_per_tick, len(footprints), "footprints/s"),
+        'oob_ratios_batch': (lambda: engine.oob_ratios(footprints), len(footprints), "footprints/s"),
+    }
+
+
+def run(sizes=ROAD_SIZES, repeat=REPEAT) -> dict:
+    results = {}
+    for n_points in sizes:
+        for name, (func, items, unit) in stages(n_points).items():
+            seconds = _time(func, repeat)
+            results.setdefault(name, {})[str(n_points)] = {
+                'seconds': seconds,
+                'throughput': items / seconds if seconds > 0 else float('inf'),
+                'unit': unit,
+                'peak_bytes': _peak_memory(func),
+            }
+            print(f"{name:<18}{n_points:>7} points {seconds * 1000:>10.3f} ms "
+                  f"{items / seconds:>14.0f} {unit:<13}{results[name][str(n_points)]['peak_bytes'] / 1024:>10.1f} KiB")
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'shapely': shapely.__version__,
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    '''Stages slower or using more memory than baseline by more than tolerance'''
+    regressions = []
+    if current['environment'] != baseline['environment']:
+        print(f"Baseline recorded in other environment: {baseline['environment']}")
+
+    for name, sizes in current['results'].items():
+        for size, result in sizes.items():
+            base = baseline['results'].get(name, {}).get(size)
+            if base is None:
+                continue
+            for key in ('seconds', 'peak_bytes'):
+                ratio = result[key] / base[key] if base[key] > 0 else 1.0
+                if ratio > 1 + tolerance:
+                    regressions.append(f"{name} {size} points: {key} {ratio:.2f}x baseline")
+    return regressions
+
+
+if __name__ == "__main__":
+    #python benchmarks.py                                   run and print
+    #python benchmarks.py --save benchmark_baseline.json    run and store as baseline
+    #python benchmarks.py --compare benchmark_baseline.json exit code 1 on regression
+    parser = argparse.ArgumentParser(description="Benchmarks of road geometry and OOB metric")
+    parser.add_argument("--sizes", type=int, nargs="+", default=ROAD_SIZES)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--save", type=Path, help="store results as baseline")
+    parser.add_argument("--compare", type=Path, help="baseline to check against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    current = run(args.sizes, args.repeat)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
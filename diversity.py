@@ -0,0 +1,113 @@
+import numpy as np
+from beamng_test_case import TestCase
+from road_features import RoadFeatures, SUMMARY_FEATURES
+
+#features spanning the road diversity, the curvature profile is left out, it is mostly noise for short streets
+SELECTION_FEATURES = ['length', 'sinuosity', 'mean_curvature', 'max_curvature', 'total_turn', 'sharp_turns',
+                      'turn_balance', 'longest_straight', 'straight_fraction', 'mean_grade', 'max_grade']
+#heavy tailed features, compared on log scale
+LOG_FEATURES = ['length', 'sinuosity', 'mean_curvature', 'max_curvature', 'total_turn', 'sharp_turns',
+                'longest_straight']
+COVERAGE_RADIUS = 1.0 #in standard deviations, a road this close to a selected one counts as covered
+
+
+class DiversitySelector:
+    '''
+        Picks roads to run so that they differ from each other and from the roads
+        already run, greedy farthest point (k-center) over standardized features.
+        Every pick is the road farthest from everything selected so far, which keeps
+        the covering radius within twice the optimum for the budget.
+        Distances to the selected set are kept, so picking is incremental and
+        one pick costs a single pass over the catalog.
+        Roads outside length_range are dropped up front, they are the outliers farthest
+        point would pick first and TestCase.is_valid rejects them anyway.
+    '''
+
+    def __init__(self, road_features: RoadFeatures, candidates: list = None, features: list = SELECTION_FEATURES,
+                 length_range: tuple = (TestCase.MIN_ROAD_LENGTH, TestCase.MAX_ROAD_LENGTH)) -> None:
+        names = road_features.names if candidates is None else [c for c in candidates if c in road_features]
+        length = road_features.rows(names)[:, SUMMARY_FEATURES.index('length')]
+        valid = (length >= length_range[0]) & (length <= length_range[1])
+        self.names = [name for name, ok in zip(names, valid) if ok]
+        self.invalid = [name for name, ok in zip(names, valid) if not ok]
+        self._rows = {name: i for i, name in enumerate(self.names)}
+
+        X = road_features.rows(self.names)[:, [SUMMARY_FEATURES.index(f) for f in features]]
+        for i, f in enumerate(features):
+            if f in LOG_FEATURES:
+                X[:, i] = np.log1p(np.maximum(X[:, i], 0))
+        if len(X):
+            std = X.std(axis=0)
+            std[std == 0] = 1
+            X = (X - X.mean(axis=0)) / std
+        self.X = X
+
+        self.distance = np.full(len(self.names), np.inf) #to the nearest selected or executed road
+        self.selected = []
+        self.executed = []
+        self.radius_history = [] #covering radius after every pick
+
+    def _add(self, i: int):
+        d = np.linalg.norm(self.X - self.X[i], axis=1)
+        np.minimum(self.distance, d, out=self.distance)
+
+    def mark_executed(self, names: list):
+        '''Roads run before, they count as covered and are never picked'''
+        for name in names:
+            i = self._rows.get(name)
+            if i is None or self.distance[i] == 0:
+                continue
+            self._add(i)
+            self.executed.append(name)
+
+    def select(self, k: int) -> list:
+        '''Next k roads, most different from everything selected or executed so far'''
+        picked = []
+        for _ in range(k):
+            if len(self.names) == 0:
+                break
+            if not np.isfinite(self.distance).any():
+                #nothing selected yet, start from the most typical road
+                i = int(np.argmin(np.linalg.norm(self.X, axis=1)))
+            else:
+                i = int(np.argmax(self.distance))
+                if self.distance[i] == 0:
+                    break #every road selected
+            self._add(i)
+            picked.append(self.names[i])
+            self.radius_history.append(self.covering_radius)
+
+        self.selected += picked
+        return picked
+
+    @property
+    def covering_radius(self) -> float:
+        '''Farthest any road is from the selected and executed ones'''
+        return float(self.distance.max()) if len(self.names) else 0.0
+
+    def coverage(self, radius: float = COVERAGE_RADIUS) -> dict:
+        '''Over the valid candidates only'''
+        covered = self.distance <= radius
+        finite = np.isfinite(self.distance)
+        return {
+            'candidates': len(self.names),
+            'invalid': len(self.invalid),
+            'selected': len(self.selected),
+            'executed': len(self.executed),
+            'covering_radius': self.covering_radius,
+            'mean_distance': float(self.distance.mean()) if finite.all() and len(self.names) else None,
+            'covered_fraction': float(covered.mean()) if len(self.names) else 1.0,
+            'radius': radius,
+        }
+
+
+def select_diverse(road_features: RoadFeatures, k: int, candidates: list = None, executed: list = ()):
+    '''Returns k street names and coverage report'''
+    selector = DiversitySelector(road_features, candidates)
+    selector.mark_executed(executed)
+    picked = selector.select(k)
+    return picked, selector.coverage()
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
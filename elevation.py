@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+from pathlib import Path
+import numpy as np
+import requests
+import profiling
+
+
+class OpenTopoDataBackend:
+    '''
+        Elevation from opentopodata.org, locations are sent in batches
+        so long streets do not hit URL length or per request location limits.
+    '''
+
+    URL = "https://api.opentopodata.org/v1/{dataset}"
+    MAX_LOCATIONS_PER_REQUEST = 100 #public API limit
+    MIN_REQUEST_INTERVAL = 1.0 #seconds, public API allows 1 request per second
+
+    def __init__(self, dataset="eudem25m", batch_size=None, min_request_interval=None) -> None:
+        self.dataset = dataset
+        self.batch_size = batch_size or self.MAX_LOCATIONS_PER_REQUEST
+        self.min_request_interval = self.MIN_REQUEST_INTERVAL if min_request_interval is None else min_request_interval
+        self._last_request = 0.0
+        self._lock = threading.Lock() #one request at a time, keeps the interval across threads
+
+    def lookup(self, lonlat: np.ndarray) -> np.ndarray:
+        elevations = np.empty(len(lonlat))
+        for start in range(0, len(lonlat), self.batch_size):
+            batch = lonlat[start:start + self.batch_size]
+            elevations[start:start + len(batch)] = self._request(batch)
+        return elevations
+
+    def _request(self, lonlat: np.ndarray) -> list:
+        locations = "|".join(f"{lat},{lon}" for lon, lat in lonlat)
+        with self._lock:
+            wait = self.min_request_interval - (time.time() - self._last_request)
+            if wait > 0:
+                time.sleep(wait)
+
+            profiling.count("elevation_requests")
+            #POST keeps locations out of the URL
+            response = requests.post(self.URL.format(dataset=self.dataset), json={'locations': locations})
+            self._last_request = time.time()
+        response.raise_for_status()
+
+        return [np.nan if p['elevation'] is None else p['elevation']
+                for p in response.json()['results']]
+
+
+class DEMBackend:
+    '''
+        Elevation sampled from a local DEM raster with bilinear interpolation.
+        The raster is a 2D array in lon/lat with GDAL style transform
+        (origin_lon, pixel_width, origin_lat, pixel_height), origin is the top left corner.
+        Points outside the pixel centres have no data and get NaN.
+    '''
+
+    def __init__(self, raster: np.ndarray, transform, dataset="dem", nodata=None) -> None:
+        self.raster = raster
+        self.origin_lon, self.pixel_width, self.origin_lat, self.pixel_height = transform
+        self.dataset = dataset
+        self.nodata = nodata
+
+    @classmethod
+    def from_npy(cls, path: Path):
+        '''
+            Memory maps raster stored as .npy,
+            transform is read from a json file next to it (same name, .json suffix)
+        '''
+        path = Path(path)
+        with open(path.with_suffix(".json"), "r") as f:
+            meta = json.load(f)
+        raster = np.load(path, mmap_mode='r')
+        return cls(raster, meta['transform'], dataset=f"dem:{path.stem}", nodata=meta.get('nodata'))
+
+    @classmethod
+    def from_geotiff(cls, path: Path, band=1):
+        '''Reads GeoTIFF with rasterio, which is not a required dependency'''
+        try:
+            import rasterio
+        except ImportError as e:
+            raise ImportError("Reading GeoTIFF needs rasterio, or convert it to .npy and use from_npy") from e
+
+        path = Path(path)
+        with rasterio.open(path) as src:
+            raster = src.read(band)
+            t = src.transform
+            nodata = src.nodata
+        return cls(raster, (t.c, t.a, t.f, t.e), dataset=f"dem:{path.stem}", nodata=nodata)
+
+    def save_npy(self, path: Path):
+        path = Path(path)
+        np.save(path, np.asarray(self.raster))
+        meta = {
+            'transform': [self.origin_lon, self.pixel_width, self.origin_lat, self.pixel_height],
+            'nodata': self.nodata,
+        }
+        with open(path.with_suffix(".json"), "w") as f:
+            json.dump(meta, f)
+
+    def lookup(self, lonlat: np.ndarray) -> np.ndarray:
+        lonlat = np.asarray(lonlat, dtype=np.float64)
+        n_rows, n_cols = self.raster.shape
+
+        #fractional pixel coordinates, pixel centres at .5
+        col = (lonlat[:, 0] - self.origin_lon) / self.pixel_width - 0.5
+        row = (lonlat[:, 1] - self.origin_lat) / self.pixel_height - 0.5
+        #no data outside the pixel centres, clamping would give edge elevations to points off the raster
+        eps = 1e-6 #pixels, rounding error of points exactly on the edge pixel centres
+        outside = (col < -eps) | (col > n_cols - 1 + eps) | (row < -eps) | (row > n_rows - 1 + eps)
+        col = np.clip(col, 0, n_cols - 1)
+        row = np.clip(row, 0, n_rows - 1)
+
+        c0 = np.minimum(np.floor(col).astype(np.int64), max(n_cols - 2, 0))
+        r0 = np.minimum(np.floor(row).astype(np.int64), max(n_rows - 2, 0))
+        c1 = np.minimum(c0 + 1, n_cols - 1)
+        r1 = np.minimum(r0 + 1, n_rows - 1)
+        dc = col - c0
+        dr = row - r0
+
+        #only the touched pixels are read from the memory map
+        z00 = self.raster[r0, c0].astype(np.float64)
+        z01 = self.raster[r0, c1].astype(np.float64)
+        z10 = self.raster[r1, c0].astype(np.float64)
+        z11 = self.raster[r1, c1].astype(np.float64)
+
+        if self.nodata is not None:
+            for z in (z00, z01, z10, z11):
+                z[z == self.nodata] = np.nan
+
+        top = z00 * (1 - dc) + z01 * dc
+        bottom = z10 * (1 - dc) + z11 * dc
+        z = top * (1 - dr) + bottom * dr
+        z[outside] = np.nan
+        return z
+
+
+class ElevationService:
+    '''
+        Deduplicated elevation lookups on top of a backend.
+        Coordinates are rounded to PRECISION decimal places (~0.1m)
+        and every unique coordinate is looked up only once.
+    '''
+
+    PRECISION = 6
+
+    def __init__(self, backend) -> None:
+        self.backend = backend
+        self.lookups = 0 #coordinates sent to the backend
+        self.requested = 0 #coordinates asked for
+        self.gaps_filled = 0 #points with no data, interpolated from neighbours
+        self._known = {}
+        #one prefetch at a time, so threads preparing roads do not look up the same coordinates twice
+        self._lock = threading.Lock()
+
+    @property
+    def dataset(self):
+        return self.backend.dataset
+
+    def _keys(self, lonlat: np.ndarray) -> np.ndarray:
+        '''Packs rounded (lon, lat) into one integer, 29 bits for lon and 28 bits for lat'''
+        scale = 10**self.PRECISION
+        lonlat = np.asarray(lonlat, dtype=np.float64)
+        lon = np.round((lonlat[:, 0] + 180) * scale).astype(np.int64)
+        lat = np.round((lonlat[:, 1] + 90) * scale).astype(np.int64)
+        return (lon << 28) | lat
+
+    def _lonlat(self, keys: np.ndarray) -> np.ndarray:
+        scale = 10**self.PRECISION
+        lon = (keys >> 28) / scale - 180
+        lat = (keys & ((1 << 28) - 1)) / scale - 90
+        return np.column_stack((lon, lat))
+
+    def prefetch(self, lines: list):
+        '''Looks up all coordinates of many lines at once'''
+        if len(lines) == 0:
+            return
+        keys = self._keys(np.concatenate([np.asarray(l)[:, 0:2] for l in lines]))
+        unique = np.unique(keys).tolist()
+
+        with self._lock:
+            self.requested += len(keys)
+            missing = np.array([k for k in unique if k not in self._known], dtype=np.int64)
+            if len(missing) == 0:
+                return
+
+            elevations = self.backend.lookup(self._lonlat(missing))
+            self.lookups += len(missing)
+            self._known.update(zip(missing.tolist(), elevations.tolist()))
+
+    def elevate(self, lonlat: np.ndarray) -> np.ndarray:
+        '''Returns (lon, lat, elevation) points'''
+        self.prefetch([lonlat])
+        return self._collect(lonlat)
+
+    def elevate_many(self, lines: list) -> list:
+        self.prefetch(lines)
+        return [self._collect(l) for l in lines]
+
+    def _collect(self, lonlat: np.ndarray) -> np.ndarray:
+        lonlat = np.asarray(lonlat)[:, 0:2]
+        known = self._known
+        elevations = np.array([known[k] for k in self._keys(lonlat).tolist()], dtype=np.float64)
+        missing = np.isnan(elevations)
+        if missing.any():
+            elevations = self._fill_gaps(lonlat, elevations, missing)
+        return np.column_stack((lonlat, elevations))
+
+    def _fill_gaps(self, lonlat: np.ndarray, elevations: np.ndarray, missing: np.ndarray) -> np.ndarray:
+        '''Points without elevation (no data in the dataset) get it interpolated along the line from their neighbours'''
+        if missing.all():
+            raise ValueError(f"No elevation in {self.dataset} for any of {len(lonlat)} points")
+        along = np.concatenate(([0], np.cumsum(np.hypot(*np.diff(lonlat, axis=0).T))))
+        filled = elevations.copy()
+        filled[missing] = np.interp(along[missing], along[~missing], elevations[~missing])
+        self.gaps_filled += int(missing.sum())
+        return filled
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requested': self.requested,
+                'looked_up': self.lookups,
+                'unique_known': len(self._known),
+                'gaps_filled': self.gaps_filled,
+            }
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
@@ -0,0 +1,240 @@
+import copy
+import os
+import time
+from pathlib import Path
+import numpy as np
+import shapely
+from abc import ABC, abstractmethod
+from beamng_test_case import BeamNGTestCase
+from oob import OOBEngine
+import profiling
+from postprocess import compute_metrics
+from telemetry import TelemetryWriter, telemetry_header
+from trajectory import unique_execution_path
+
+class Executor(ABC):
+    '''
+        Runs a test case, reading the vehicle every test_case.interval.
+        Simulator backends implement loading the scenario, reading the vehicle
+        and advancing time, metrics and end conditions are shared.
+    '''
+
+    TIME_BUDGET = 60 #60secs
+    GOAL_DISTANCE_THRESHOLD = 8 #if car is 8 meters from goal, the goal is reached
+    TELEMETRY_FLUSH_EVERY = 20 #ticks, 2 seconds of a run with the default 0.1s interval
+
+    def __init__(self, results_dir: Path, test_case: BeamNGTestCase, ai_on=True, record_only=False,
+                 verbose=False, oracles: list = None) -> None:
+        self.results_dir = results_dir #if None, execution data is not saved
+        self.test_case = test_case
+        self.ai_on = ai_on
+        self.end = False
+        self.record_only = record_only #only raw data during run, metrics computed after it
+        self.oob_engine = OOBEngine(test_case.road)
+        self.goal = shapely.Point(test_case.waypoint_position)
+        self.footprint = None #car footprint read in the current tick
+        self.oob = None #oob ratio of the current tick, None until computed
+        #early termination, see oracles.py, every run gets own copies as they keep state
+        self.oracles = [copy.deepcopy(oracle) for oracle in oracles or []]
+        self.stopped_by = None
+        self.verbose = verbose #print every tick, from the telemetry thread
+        self.telemetry = None
+        self.saved_path = None #json header of the saved result
+        self.n_ticks = 0
+        self.test_case.reserve_trajectory(int(np.ceil(self.TIME_BUDGET / test_case.interval)) + 1)
+
+    @abstractmethod
+    def _load(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _start(self):
+        '''Starts simulation, time budget is counted from here'''
+        raise NotImplementedError
+
+    @abstractmethod
+    def _car_footprint(self) -> np.ndarray:
+        '''Corners of the car bottom, (4, 3) array'''
+        raise NotImplementedError
+
+    @abstractmethod
+    def _vehicle_state(self):
+        '''Returns (position, velocity) or None if not available'''
+        raise NotImplementedError
+
+    @abstractmethod
+    def _wait_for_next_tick(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _elapsed(self) -> float:
+        '''Seconds of simulation since start'''
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def _tick_timing(self) -> dict:
+        '''Summary of how ticks kept to the interval, None if time is simulated'''
+        return None
+
+    def execute(self):
+        with profiling.collect(self.test_case.profile):
+            with profiling.span("load"):
+                self._load()
+            self._run()
+
+    def _car_surface(self) -> shapely.Polygon:
+        return shapely.Polygon(self.footprint)
+
+    def _oob_ratio(self):
+        return self.oob_engine.oob_ratio(self.footprint)
+
+    def current_oob(self) -> float:
+        '''Oob ratio of this tick, computed at most once even when only recording'''
+        if self.oob is None:
+            self.oob = self._oob_ratio()
+        return self.oob
+
+    def _distance_to_goal(self):
+        car = self._car_surface()
+        return car.distance(self.goal)
+    
+    def _has_no_time(self):
+        return self._elapsed() >= self.TIME_BUDGET
+    
+    def _goal_reached(self):
+        d = self._distance_to_goal()
+        return d < self.GOAL_DISTANCE_THRESHOLD
+    
+    def _check_end_conditions(self):
+        if self._has_no_time():
+            self.end = True
+            self.test_case.execution_data['finish'] = "Out of time"
+            self.test_case.execution_data['success'] = False
+            if self.verbose:
+                print("Out of time, closing")
+
+        if self._goal_reached():
+            self.end = True
+            self.test_case.execution_data['finish'] = "Goal Reached"
+            self.test_case.execution_data['success'] = True
+            if self.verbose:
+                print("Goal reached successfully quiting")
+
+        if not self.end:
+            self._consult_oracles()
+
+    def _consult_oracles(self):
+        elapsed = self._elapsed()
+        for oracle in self.oracles:
+            if elapsed < oracle.grace or not oracle.observe(self, elapsed):
+                continue
+            self.end = True
+            self.stopped_by = oracle
+            self.test_case.execution_data['finish'] = oracle.FINISH
+            self.test_case.execution_data['success'] = False
+            if self.verbose:
+                print(f"{oracle.FINISH}, stopping early")
+            return
+
+    def _record_time_saved(self, loop_seconds: float):
+        '''Part of the time budget the oracle did not let the run waste, simulated and wall seconds'''
+        elapsed = self._elapsed()
+        saved = max(self.TIME_BUDGET - elapsed, 0.0)
+        #stepped runs are not real time, wall time scales by how fast the simulation ran
+        wall_saved = saved * loop_seconds / elapsed if elapsed > 0 else 0.0
+        self.test_case.execution_data['time_saved'] = {'simulated': saved, 'wall': wall_saved}
+        profiling.count("oracle_stops")
+        profiling.count(f"stopped_{type(self.stopped_by).__name__}")
+        profiling.count("wall_seconds_saved", wall_saved)
+
+    def _read_execution_data(self):
+        self.footprint = self._car_footprint()
+        self.oob = None
+        self.test_case.execution_data['bbox'].append(self.footprint)
+
+        oob = None
+        if not self.record_only:
+            oob = self.current_oob()
+            self.test_case.execution_data['out_of_bounds'].append(oob)
+
+        pos, vel = None, None
+        state = self._vehicle_state()
+        if state is not None:
+            pos, vel = state
+            self.test_case.execution_data['position'].append(pos)
+            self.test_case.execution_data['velocity'].append(vel)
+
+        self.telemetry.append(self.n_ticks, self._elapsed(), oob, self.footprint, pos, vel)
+        self.n_ticks += 1
+
+    def _tick(self):
+        try:
+            self._read_execution_data()
+            self._check_end_conditions()
+        except Exception as e:
+            self.end = True
+            self.test_case.execution_data['finish'] = f"Exception {e}"
+            self.test_case.execution_data['success'] = False
+            print(e.__repr__())
+
+    def _open_telemetry(self):
+        '''Streams ticks next to the results, so a crashed run can be recovered'''
+        path = None
+        if self.results_dir is not None:
+            path = unique_execution_path(self.results_dir, self.test_case.road.name).with_suffix(".telemetry")
+        self.telemetry = TelemetryWriter(path, telemetry_header(self.test_case.execution_data),
+                                         flush_every=self.TELEMETRY_FLUSH_EVERY, console=self.verbose)
+
+    def discard_results(self):
+        '''Removes what the run left in results_dir, saved result or telemetry log, e.g. before a retry'''
+        paths = []
+        if self.saved_path is not None:
+            paths += [self.saved_path, self.saved_path.with_suffix(".npz")]
+        if self.telemetry is not None and self.telemetry.path is not None:
+            paths.append(self.telemetry.path)
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _run(self):
+        self._open_telemetry()
+        try:
+            self._start()
+            for oracle in self.oracles:
+                oracle.reset(self)
+            loop_start = time.perf_counter()
+            with profiling.span("tick_loop"):
+                while not self.end:
+                    self._tick()
+                    self._wait_for_next_tick()
+            if self.stopped_by is not None:
+                self._record_time_saved(time.perf_counter() - loop_start)
+        finally:
+            profiling.count("ticks", self.n_ticks)
+            #on a crash the log keeps what was recorded, see telemetry.recover_results_dir
+            self.telemetry.close()
+
+        tick_timing = self._tick_timing()
+        if tick_timing is not None:
+            self.test_case.execution_data['tick_timing'] = tick_timing
+
+        if self.record_only:
+            with profiling.span("metrics"):
+                self.test_case.execution_data.update(compute_metrics(self.test_case.execution_data))
+        #saving itself is counted in the campaign only
+        self.test_case.execution_data['profile'] = self.test_case.profile.snapshot()
+        if self.results_dir is not None:
+            with profiling.span("save_results"):
+                self.saved_path = self.test_case.save_execution_data(self.results_dir)
+        #full result is saved, the log is not needed anymore
+        if self.telemetry.path is not None:
+            os.remove(self.telemetry.path)
+        self._close()
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
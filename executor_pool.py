@@ -0,0 +1,155 @@
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+from beamng_executor import BeamNGExecutor
+from beamng_session import BeamNGSession
+
+
+class ExecutorPool:
+    '''
+        Runs test cases on several simulator instances at once.
+        Every instance has its own port and user directory (so its own level file),
+        a worker thread per instance takes the next test case as soon as it is free.
+        Test cases lost because the simulator crashed are retried on any worker.
+    '''
+
+    BASE_PORT = 64256
+
+    def __init__(self, beamng_home: Path, user_root: Path, results_dir: Path, n_instances: int = 2,
+                 user_template: Path = None, base_port: int = BASE_PORT, max_retries: int = 2,
+                 executor_kwargs: dict = None, bng_factory=None) -> None:
+        self.beamng_home = beamng_home
+        self.results_dir = results_dir
+        self.max_retries = max_retries
+        self.executor_kwargs = executor_kwargs or {}
+        self.user_template = user_template
+
+        #nothing touches the disk or launches until the first run
+        kwargs = {} if bng_factory is None else {'bng_factory': bng_factory}
+        self.sessions = [BeamNGSession(beamng_home, Path(user_root) / f"instance_{i}", port=base_port + i, **kwargs)
+                         for i in range(n_instances)]
+        self.prepared = False
+
+        self.retried = 0
+        self.lost = 0
+        self.idle_seconds = 0.0 #workers waiting for the next test case between runs
+        self._lock = threading.Lock() #counters are updated by all workers
+
+    def _prepare_user_dirs(self):
+        '''Copies configured user directory (e.g. with smallgrid level override) for every new instance'''
+        for session in self.sessions:
+            if self.user_template is not None and not session.beamng_user.exists():
+                shutil.copytree(self.user_template, session.beamng_user)
+            session.road_file_path.parent.mkdir(parents=True, exist_ok=True)
+        self.prepared = True
+
+    @property
+    def n_instances(self):
+        return len(self.sessions)
+
+    def run(self, test_cases, max_pending: int = None):
+        '''
+            Executes test cases, yields (index, test_case) in the order they finish.
+            test_cases can be any iterable, e.g. a generator preparing them lazily.
+            With max_pending, no more test cases are taken from it while that many
+            are running or queued, so a lazy generator is not drained ahead of the simulators.
+        '''
+        if not self.prepared:
+            self._prepare_user_dirs()
+
+        jobs = queue.Queue()
+        results = queue.Queue()
+        workers = [threading.Thread(target=self._work, args=(session, jobs, results), daemon=True)
+                   for session in self.sessions]
+        for worker in workers:
+            worker.start()
+
+        try:
+            pending = 0
+            for i, test_case in enumerate(test_cases):
+                jobs.put((i, test_case, 0))
+                pending += 1
+                while max_pending is not None and pending >= max_pending:
+                    pending -= 1
+                    yield results.get()
+                #hand back what already finished while the rest is being queued
+                while not results.empty():
+                    pending -= 1
+                    yield results.get()
+
+            while pending > 0:
+                pending -= 1
+                yield results.get()
+        finally:
+            for _ in workers:
+                jobs.put(None)
+
+    def _work(self, session: BeamNGSession, jobs: queue.Queue, results: queue.Queue):
+        finished = None #when the previous test case of this worker ended
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            if finished is not None:
+                with self._lock:
+                    self.idle_seconds += time.perf_counter() - finished
+
+            i, test_case, attempt = job
+            executor = None
+            crashed = False
+            try:
+                test_case.file_path = session.road_file_path
+                test_case.reset_execution_data()
+                executor = BeamNGExecutor(beamng_home=self.beamng_home,
+                                          beamng_user=session.beamng_user,
+                                          results_dir=self.results_dir,
+                                          test_case=test_case,
+                                          session=session,
+                                          **self.executor_kwargs)
+                executor.execute()
+                crashed = not session.is_alive()
+            except Exception as e:
+                print(f"Worker on port {session.port} failed: {e!r}")
+                test_case.execution_data['finish'] = f"Exception {e}"
+                test_case.execution_data['success'] = False
+                crashed = True
+
+            finished = time.perf_counter()
+            if crashed and attempt < self.max_retries:
+                #the retry saves its own result, a partial one must not stay next to it
+                if executor is not None:
+                    executor.discard_results()
+                with self._lock:
+                    self.retried += 1
+                jobs.put((i, test_case, attempt + 1))
+                continue
+
+            if crashed:
+                with self._lock:
+                    self.lost += 1
+            results.put((i, test_case))
+
+    def stats(self) -> dict:
+        return {
+            'instances': self.n_instances,
+            'retried': self.retried,
+            'lost': self.lost,
+            'idle_seconds': self.idle_seconds,
+            'sessions': [s.stats() for s in self.sessions],
+        }
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
@@ -0,0 +1,27 @@
+import json
+import numpy as np
+
+#optional, serializes NumPy arrays directly without going through Python lists
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    '''One line JSON of obj, NumPy arrays and scalars allowed anywhere in it'''
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY, default=_default)
+    return json.dumps(obj, default=_default).encode("utf-8")
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
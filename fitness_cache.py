@@ -0,0 +1,86 @@
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+import numpy as np
+
+
+class FitnessCache:
+    '''
+        Fitness of already evaluated GA genomes, stored in SQLite so it survives across runs.
+        Key is a hash of the genome rounded to QUANTUM plus the evaluation settings,
+        so changing e.g. speed limit or score definition does not reuse old values.
+    '''
+
+    QUANTUM = 0.01
+
+    def __init__(self, path: Path, settings: dict) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.settings = json.dumps(settings, sort_keys=True)
+
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS fitness (key TEXT PRIMARY KEY, fitness REAL, settings TEXT)")
+        self.connection.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self._generation_hits = 0
+        self._generation_misses = 0
+
+    def key(self, solution) -> str:
+        genome = np.round(np.asarray(solution, dtype=np.float64) / self.QUANTUM).astype(np.int64)
+        h = hashlib.sha1(self.settings.encode("utf-8"))
+        h.update(genome.tobytes())
+        return h.hexdigest()
+
+    def get(self, solution):
+        row = self.connection.execute(
+            "SELECT fitness FROM fitness WHERE key = ?", (self.key(solution),)).fetchone()
+        if row is None:
+            self.misses += 1
+            self._generation_misses += 1
+            return None
+
+        self.hits += 1
+        self._generation_hits += 1
+        return row[0]
+
+    def count_hits(self, n: int):
+        '''Lookups answered without the cache, e.g. duplicate genomes of a batch evaluated once'''
+        self.hits += n
+        self._generation_hits += n
+
+    def put(self, solution, fitness: float):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO fitness VALUES (?, ?, ?)",
+            (self.key(solution), float(fitness), self.settings))
+        self.connection.commit()
+
+    def generation_stats(self) -> dict:
+        '''Hit rate since the previous call, meant to be called once per generation'''
+        lookups = self._generation_hits + self._generation_misses
+        stats = {
+            'hits': self._generation_hits,
+            'misses': self._generation_misses,
+            'hit_rate': self._generation_hits / lookups if lookups else 0.0,
+        }
+        self._generation_hits = 0
+        self._generation_misses = 0
+        return stats
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
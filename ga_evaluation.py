@@ -0,0 +1,133 @@
+from pathlib import Path
+from beamng_test_case import BeamNGTestCase
+from executor import Executor
+from executor_pool import ExecutorPool
+from fitness_cache import FitnessCache
+from kinematic_executor import KinematicExecutor
+from multi_fidelity import INVALID_FITNESS, MultiFidelityEvaluator
+
+
+class GAEvaluation:
+    '''
+        Fitness of a whole GA generation at once, shared by the GA scripts.
+        Known genomes come from the fitness cache, invalid roads are rejected up front,
+        the rest is simulated concurrently on the executor pool (only the promising ones
+        with multi-fidelity), or one by one in the headless kinematic simulator.
+        build_test(ga_instance, solution, solution_idx) returns a test case or None if the road is not valid,
+        score(execution_data) returns the fitness of a run.
+    '''
+
+    def __init__(self, build_test, score, results_dir: Path, fitness_cache_path: Path, settings: dict,
+                 simulator: str = "beamng", stepped: bool = True, oracles: list = (), pool_kwargs: dict = None,
+                 multi_fidelity: bool = False, promote_fraction: float = 0.25) -> None:
+        self.build_test = build_test
+        self.score = score
+        self.results_dir = results_dir
+        self.simulator = simulator #"beamng" or "kinematic", the kinematic one runs without BeamNG installed
+        self.oracles = list(oracles)
+        self.fitness_cache_path = fitness_cache_path
+        #everything the fitness depends on besides the genome, so changing it does not reuse cached values
+        self.settings = {
+            **settings,
+            'time_budget': Executor.TIME_BUDGET,
+            'simulator': simulator,
+            'stepped': stepped,
+            'oracles': [oracle.config() for oracle in self.oracles],
+        }
+        self._fitness_cache = None
+
+        #nothing launches until the first generation is simulated
+        self.pool = None
+        if simulator == "beamng":
+            self.pool = ExecutorPool(results_dir=results_dir,
+                                     executor_kwargs={'ai_on': True, 'stepped': stepped, 'oracles': self.oracles},
+                                     **(pool_kwargs or {}))
+
+        #screen every generation with a surrogate, simulate only the top fraction
+        self.evaluator = None
+        if multi_fidelity:
+            self.evaluator = MultiFidelityEvaluator(self.simulate_batch, score=score, promote_fraction=promote_fraction)
+
+    @property
+    def fitness_cache(self) -> FitnessCache:
+        '''Opened on first use, so importing a GA script does not create the sqlite file'''
+        if self._fitness_cache is None:
+            self._fitness_cache = FitnessCache(self.fitness_cache_path, self.settings)
+        return self._fitness_cache
+
+    def simulate(self, test: BeamNGTestCase) -> float:
+        '''Headless kinematic run in this process, BeamNG runs go through the pool'''
+        KinematicExecutor(results_dir=self.results_dir, test_case=test, ai_on=True, oracles=self.oracles).execute()
+
+        fitness = self.score(test.execution_data)
+        print(f"Fitness value: {fitness}")
+        return fitness
+
+    def simulate_batch(self, tests: list) -> list:
+        '''Runs tests on all pool workers at once, results come back out of order'''
+        if self.pool is None:
+            return [self.simulate(t) for t in tests]
+
+        fitness = [None] * len(tests)
+        for i, test in self.pool.run(tests):
+            fitness[i] = self.score(test.execution_data)
+            print(f"{test.road.name} fitness value: {fitness[i]}")
+        return fitness
+
+    def evaluate(self, ga_instance, solutions, solutions_idx) -> list:
+        '''
+            pygad batch fitness_func, invalid roads get INVALID_FITNESS.
+            Duplicate genomes of the batch are built and simulated once, the copies count as cache hits.
+        '''
+        first = {} #cache key -> first solution with it
+        duplicates = {} #solution -> first solution with the same genome
+        for k, solution in enumerate(solutions):
+            duplicates[k] = first.setdefault(self.fitness_cache.key(solution), k)
+        unique = sorted(first.values())
+        self.fitness_cache.count_hits(len(solutions) - len(unique))
+
+        fitness = [None] * len(solutions)
+        for k in unique:
+            fitness[k] = self.fitness_cache.get(solutions[k])
+        todo = [k for k in unique if fitness[k] is None]
+
+        tests = {k: self.build_test(ga_instance, solutions[k], solutions_idx[k]) for k in todo}
+        valid = [k for k in todo if tests[k] is not None]
+        for k in todo:
+            if tests[k] is None:
+                fitness[k] = INVALID_FITNESS
+                self.fitness_cache.put(solutions[k], INVALID_FITNESS)
+
+        valid_tests = [tests[k] for k in valid]
+        if self.evaluator is not None:
+            valid_fitness = self.evaluator.evaluate(valid_tests)
+            simulated = self.evaluator.last_simulated
+            print(f"Multi-fidelity: {self.evaluator.stats()}")
+        else:
+            valid_fitness = self.simulate_batch(valid_tests)
+            simulated = [True] * len(valid_tests)
+
+        for k, f, was_simulated in zip(valid, valid_fitness, simulated):
+            fitness[k] = f
+            if was_simulated: #surrogate estimates are not worth remembering
+                self.fitness_cache.put(solutions[k], f)
+
+        return [fitness[duplicates[k]] for k in range(len(solutions))]
+
+    def stats(self) -> dict:
+        stats = {'fitness_cache': self._fitness_cache.stats() if self._fitness_cache is not None else None}
+        if self.evaluator is not None:
+            stats['multi_fidelity'] = self.evaluator.stats()
+        if self.pool is not None:
+            stats['executor_pool'] = self.pool.stats()
+        return stats
+
+    def close(self):
+        if self._fitness_cache is not None:
+            self._fitness_cache.close()
+        if self.pool is not None:
+            self.pool.close()
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
@@ -0,0 +1,133 @@
+from pathlib import Path
+import numpy as np
+from beamng_test_case import BeamNGTestCase
+from executor import Executor
+
+
+class KinematicExecutor(Executor):
+    '''
+        Headless stand-in for BeamNG, pure NumPy.
+        Kinematic bicycle model driven by a pure pursuit controller following
+        the middle of the right lane and keeping to test_case.max_speed.
+        Time is simulated, so a run takes a fraction of real time.
+    '''
+
+    CAR_LENGTH = 4.9 #meters, about etk800
+    CAR_WIDTH = 1.9
+    WHEELBASE = 2.9
+    MAX_STEER = np.radians(35)
+    MAX_ACCELERATION = 3.0 #m/s^2
+    MAX_DECELERATION = 6.0
+    MAX_LATERAL_ACCELERATION = 4.0
+    LOOKAHEAD_MIN = 4.0 #meters
+    LOOKAHEAD_TIME = 0.8 #seconds, lookahead grows with speed
+    PHYSICS_STEP = 0.02 #seconds
+    SEARCH_WINDOW = 50 #path points searched ahead for the nearest one
+
+    def __init__(self, results_dir: Path, test_case: BeamNGTestCase, ai_on=True, record_only=False,
+                 verbose=False, oracles: list = None) -> None:
+        super().__init__(results_dir, test_case, ai_on=ai_on, record_only=record_only, verbose=verbose,
+                         oracles=oracles)
+
+    def _load(self):
+        road = self.test_case.road
+        #middle of the right lane
+        self.path = (road.points + road.right_edge) / 2
+        segment_lengths = np.linalg.norm(np.diff(self.path[:, 0:2], axis=0), axis=1)
+        self.arc_length = np.concatenate(([0], np.cumsum(segment_lengths)))
+        self.speed_profile = self._speed_profile(segment_lengths)
+
+        pos, _ = self.test_case.vehicle_start_pose()
+        direction = self.path[1, 0:2] - self.path[0, 0:2]
+
+        self.x, self.y = pos[0], pos[1]
+        self.yaw = np.arctan2(direction[1], direction[0])
+        self.speed = 0.0
+        self.nearest = 0
+        self.sim_time = 0.0
+
+    def _speed_profile(self, segment_lengths: np.ndarray) -> np.ndarray:
+        '''Highest speed at each path point, limited by curvature and braking before bends'''
+        headings = np.arctan2(*np.diff(self.path[:, 0:2], axis=0).T[::-1])
+        turn = np.abs(np.angle(np.exp(1j * np.diff(headings))))
+        mean_length = np.maximum((segment_lengths[:-1] + segment_lengths[1:]) / 2, 1e-6)
+        curvature = np.concatenate(([0], turn / mean_length, [0]))
+
+        limit = np.sqrt(self.MAX_LATERAL_ACCELERATION / np.maximum(curvature, 1e-9))
+        limit = np.minimum(limit, self.test_case.max_speed)
+        limit[-1] = 0.0 #stop at the end of the road
+
+        #backward pass, be slow enough to brake in time
+        for i in range(len(limit) - 2, -1, -1):
+            braking = np.sqrt(limit[i+1]**2 + 2 * self.MAX_DECELERATION * segment_lengths[i])
+            limit[i] = min(limit[i], braking)
+        return limit
+
+    def _start(self):
+        self.sim_time = 0.0
+
+    def _elapsed(self) -> float:
+        return self.sim_time
+
+    def _wait_for_next_tick(self):
+        steps = max(1, int(round(self.test_case.interval / self.PHYSICS_STEP)))
+        dt = self.test_case.interval / steps
+        for _ in range(steps):
+            self._step(dt)
+        self.sim_time += self.test_case.interval
+
+    def _find_nearest(self):
+        window = self.path[self.nearest:self.nearest + self.SEARCH_WINDOW, 0:2]
+        d = np.hypot(window[:, 0] - self.x, window[:, 1] - self.y)
+        self.nearest += int(np.argmin(d))
+
+    def _step(self, dt: float):
+        if not self.ai_on:
+            return
+
+        self._find_nearest()
+        lookahead = max(self.LOOKAHEAD_MIN, self.LOOKAHEAD_TIME * self.speed)
+        target_i = np.searchsorted(self.arc_length, self.arc_length[self.nearest] + lookahead)
+        target_i = min(target_i, len(self.path) - 1)
+        tx, ty = self.path[target_i, 0:2]
+
+        #pure pursuit
+        alpha = np.arctan2(ty - self.y, tx - self.x) - self.yaw
+        distance = max(np.hypot(tx - self.x, ty - self.y), 1e-6)
+        steer = np.arctan2(2 * self.WHEELBASE * np.sin(alpha), distance)
+        steer = np.clip(steer, -self.MAX_STEER, self.MAX_STEER)
+
+        target_speed = self.speed_profile[self.nearest]
+        acceleration = np.clip((target_speed - self.speed) / dt, -self.MAX_DECELERATION, self.MAX_ACCELERATION)
+
+        #kinematic bicycle
+        self.x += self.speed * np.cos(self.yaw) * dt
+        self.y += self.speed * np.sin(self.yaw) * dt
+        self.yaw += self.speed / self.WHEELBASE * np.tan(steer) * dt
+        self.speed = max(0.0, self.speed + acceleration * dt)
+
+    @property
+    def _height(self) -> float:
+        return float(self.path[self.nearest, 2])
+
+    def _car_footprint(self) -> np.ndarray:
+        forward = np.array([np.cos(self.yaw), np.sin(self.yaw)]) * self.CAR_LENGTH / 2
+        left = np.array([-np.sin(self.yaw), np.cos(self.yaw)]) * self.CAR_WIDTH / 2
+        centre = np.array([self.x, self.y])
+
+        corners = np.array([
+            centre + forward + left, #front_bottom_left
+            centre + forward - left, #front_bottom_right
+            centre - forward - left, #rear_bottom_right
+            centre - forward + left, #rear_bottom_left
+        ])
+        return np.column_stack((corners, np.full(4, self._height)))
+
+    def _vehicle_state(self):
+        pos = [self.x, self.y, self._height]
+        vel = [self.speed * np.cos(self.yaw), self.speed * np.sin(self.yaw), 0.0]
+        return pos, vel
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
@@ -2,19 +2,30 @@ from roads import OSMRoad, Road
 from beamng_test_case import BeamNGTestCase
 from pathlib import Path
 import json
-from beamng_executor import BeamNGExecutor
-import time
-import random
+from osm_cache import OSMRoadCache
+from osm_index import StreetIndex
+from elevation import ElevationService, OpenTopoDataBackend
+from executor_pool import ExecutorPool
+from preparation import PreparationPipeline
+from results_catalog import ResultsCatalog
+from road_features import RoadFeatures
+from diversity import DiversitySelector
+import profiling
 
 
-def get_k_random_streets_from_file(path: Path, k: int):
+def get_streets_from_file(path: Path):
     with open(path, "r") as f:
         test_cases = json.load(f)
 
-    bbox = test_cases['bbox']
-    streets = test_cases['streets']
-    random_streets = random.sample(streets, k)
-    return bbox, random_streets
+    return test_cases['bbox'], test_cases['streets']
+
+def get_k_diverse_streets(streets: list, k: int, road_features: RoadFeatures, executed: list):
+    '''k streets most different from each other and from the executed ones'''
+    selector = DiversitySelector(road_features, candidates=streets)
+    selector.mark_executed(executed)
+    diverse_streets = selector.select(k)
+    print(f"Test selection: {selector.coverage()}")
+    return diverse_streets
 
 if __name__ == "__main__":
 
@@ -25,25 +36,66 @@ if __name__ == "__main__":
     BEAMNG_HOME_PATH = MAIN_DIR / 'BeamNG.tech.v0.21.3.0'
     ROAD_FILE_PATH = BEAMNG_USER_PATH / 'levels' / "smallgrid" / 'main' / 'MissionGroup' / 'Roads' / 'items.level.json'
     RESULTS_PATH = Path('results') / 'osm'
+    OSM_CACHE_PATH = Path('cache') / 'osm'
+    STREET_INDEX_PATH = Path('cache') / 'street_index.npz'
+    ROAD_FEATURES_PATH = Path('cache') / 'road_features.npz'
+    RESULTS_CATALOG_PATH = Path('cache') / 'results.sqlite'
     MAX_SPEED = 13.4112 # 30mph Uk speed limit for residential roads
     
     K_TESTS = 5
-    bbox, streets = get_k_random_streets_from_file("streets.json", K_TESTS)
-
-    for i, street_name in enumerate(streets):
+    ADAPTIVE_RESAMPLING = True #fewer nodes on straights, more in bends, see Road._adaptive_resample
+    PROFILE_PHASE = None #e.g. "tick_loop", cProfile stats are written to profiles/
+    if PROFILE_PHASE is not None:
+        profiling.enable_cprofile(PROFILE_PHASE)
+    bbox, all_streets = get_streets_from_file("streets.json")
+    cache = OSMRoadCache(OSM_CACHE_PATH)
+    street_index = StreetIndex.load_or_ingest(STREET_INDEX_PATH, bbox)
+    #streets already run count as covered, so each campaign explores what was not tested yet
+    catalog = ResultsCatalog(RESULTS_CATALOG_PATH)
+    executed = []
+    if RESULTS_PATH.exists():
+        catalog.ingest(RESULTS_PATH)
+        executed = [row['name'] for row in catalog.query("results_set = ?", (RESULTS_PATH.name,), columns=['name'])]
+    catalog.close()
+    road_features = RoadFeatures.load_or_compute(ROAD_FEATURES_PATH, street_index)
+    streets = get_k_diverse_streets(all_streets, K_TESTS, road_features, executed)
+    elevation = ElevationService(OpenTopoDataBackend(OSMRoad.ELEVATION_DATASET))
+    #one deduplicated lookup for all selected streets that are not cached yet
+    elevation.prefetch([street_index.get(s) for s in streets
+                        if s in street_index and not cache.contains(bbox, s, elevation.dataset)])
+    N_INSTANCES = 1 #simulators running tests in parallel, each with own copy of user dir
+    pool = ExecutorPool(BEAMNG_HOME_PATH,
+                        user_root=MAIN_DIR / 'beamng_user' / 'pool',
+                        results_dir=RESULTS_PATH,
+                        n_instances=N_INSTANCES,
+                        user_template=BEAMNG_USER_PATH,
+                        executor_kwargs={'ai_on': False, 'record_only': True})
 
-        print(f"{i+1}/{K_TESTS}: {street_name}")
-        time.sleep(1)
+    PREPARE_AHEAD = 3 #test cases prepared in background while the simulators run
+    PREPARE_WORKERS = 2
 
+    def prepare_test(street_name: str) -> BeamNGTestCase:
         road = OSMRoad(
             bbox=bbox,
             street_name=street_name,
+            cache=cache,
+            street_index=street_index,
+            elevation=elevation,
+            adaptive=ADAPTIVE_RESAMPLING,
             )
         test = BeamNGTestCase(road, ROAD_FILE_PATH, 
                               max_speed=MAX_SPEED, visualise=False)
+        #level file serialized here rather than while the simulator waits
+        test.prepare_level_file()
+        return test
+
+    pipeline = PreparationPipeline(prepare_test, streets, lookahead=PREPARE_AHEAD, n_workers=PREPARE_WORKERS)
+    with pool:
+        #one test case queued per simulator, the pipeline keeps the next ones ready
+        for i, test in pool.run(pipeline, max_pending=2 * N_INSTANCES):
+            print(f"{test.road.name}: {test.execution_data['finish']}")
 
-        BeamNGExecutor(beamng_home=BEAMNG_HOME_PATH,
-                    beamng_user=BEAMNG_USER_PATH,
-                    results_dir=RESULTS_PATH,
-                    test_case=test,
-                    ai_on=False).execute()
\ No newline at end of file
+    print(f"OSM cache: {cache.stats()}")
+    print(f"Preparation: {pipeline.stats()}")
+    print(f"Executor pool: {pool.stats()}")
+    print(profiling.CAMPAIGN.report())
\ No newline at end of file
@@ -2,7 +2,10 @@ from roads import OSMRoad, Road
 from beamng_test_case import BeamNGTestCase
 from pathlib import Path
 import json
-from beamng_executor import BeamNGExecutor
+from ga_evaluation import GAEvaluation
+from postprocess import METRICS_VERSION, oob_score
+import profiling
+from oracles import progress_oracles
 import time
 import random
 import pygad
@@ -13,23 +16,36 @@ BEAMNG_USER_PATH = MAIN_DIR / 'beamng_user' / '0.21'
 BEAMNG_HOME_PATH = MAIN_DIR / 'BeamNG.tech.v0.21.3.0'
 ROAD_FILE_PATH = BEAMNG_USER_PATH / 'levels' / "smallgrid" / 'main' / 'MissionGroup' / 'Roads' / 'items.level.json'
 RESULTS_PATH = Path('results') / 'ga'
+FITNESS_CACHE_PATH = Path('cache') / 'fitness_ga.sqlite'
 MAX_SPEED = 13.4112 # 30mph Uk speed limit for residential roads
 MAX_ROAD_LENGTH = 2000 #meters
 MIN_ROAD_LENGTH = 100 #meters
 NUM_GA_POINTS = 10
 
+#"beamng" or "kinematic", the kinematic one runs headless without BeamNG installed
+SIMULATOR = "beamng"
+#deterministic BeamNG advanced by fixed physics steps per tick, reproducible fitness, not tied to real time
+STEPPED = True
+#stop hopeless runs (stuck, not moving along the road) before the time budget, see oracles.py
+#out of bounds oracles are not used, score() rewards runs reaching the goal with much oob
+ORACLES = progress_oracles()
+#phase to run under cProfile, e.g. "tick_loop", stats are written to profiles/
+PROFILE_PHASE = None
+if PROFILE_PHASE is not None:
+    profiling.enable_cprofile(PROFILE_PHASE)
 #evaluates execution
 def score(execution_data: dict) -> float:
     if not execution_data['success']:
         return -1
     
-    oobs = execution_data['out_of_bounds']
-    length = execution_data['length']
-    OOBS_RATION_VALUE = 100
-    score = (sum(oobs) / length) * OOBS_RATION_VALUE
-    return score
+    return oob_score(execution_data['out_of_bounds'], execution_data['length'])
 
-def fitness_func(ga_instance, solution, solution_idx):
+#version of score(), bump when it changes so cached fitness is not reused,
+#changes of the oob score formula are covered by METRICS_VERSION
+SCORE_VERSION = 1
+
+def build_test(ga_instance, solution, solution_idx):
+    '''Returns test case for the solution, or None if the road is not valid'''
     print(f"Evaluating road: {solution_idx}")
     points = np.array(solution).reshape(NUM_GA_POINTS, 3)
     road = Road(
@@ -39,18 +55,32 @@ def fitness_func(ga_instance, solution, solution_idx):
     
     test = BeamNGTestCase(road, ROAD_FILE_PATH, max_speed=MAX_SPEED, visualise=True)
     if not test.is_valid():
-        return -1
-    
-    BeamNGExecutor(beamng_home=BEAMNG_HOME_PATH,
-                beamng_user=BEAMNG_USER_PATH,
-                results_dir=RESULTS_PATH,
-                test_case=test,
-                ai_on=True).execute()
-    
-    fitness = score(test.execution_data)
-    print(f"Fitness value: {fitness}")
-    return fitness
-    
+        return None
+    return test
+
+#screen every generation with a surrogate, simulate only the top quarter,
+#off by default as screened candidates get estimated rather than simulated fitness
+MULTI_FIDELITY = False
+#simulators evaluating a generation concurrently, each with own copy of user dir
+N_WORKERS = 1
+EVALUATION = GAEvaluation(build_test, score,
+                          results_dir=RESULTS_PATH,
+                          fitness_cache_path=FITNESS_CACHE_PATH,
+                          settings={'max_speed': MAX_SPEED, 'score_version': SCORE_VERSION,
+                                    'metrics_version': METRICS_VERSION},
+                          simulator=SIMULATOR,
+                          stepped=STEPPED,
+                          oracles=ORACLES,
+                          pool_kwargs={'beamng_home': BEAMNG_HOME_PATH,
+                                       'user_root': MAIN_DIR / 'beamng_user' / 'pool',
+                                       'n_instances': N_WORKERS,
+                                       'user_template': BEAMNG_USER_PATH},
+                          multi_fidelity=MULTI_FIDELITY,
+                          promote_fraction=0.25)
+
+def fitness_batch_func(ga_instance, solutions, solutions_idx):
+    '''Whole generation at once, see GAEvaluation'''
+    return EVALUATION.evaluate(ga_instance, solutions, solutions_idx)
 
 def rand_population():
     sol = []
@@ -62,6 +92,10 @@ def rand_population():
 
     return sol
 
+def on_new_generation(ga_instance):
+    print("Generation : ", ga_instance.generations_completed)
+    print("Fitness cache :", EVALUATION.fitness_cache.generation_stats())
+
 if __name__ == "__main__":
 
     sol_per_pop = 8
@@ -71,13 +105,17 @@ if __name__ == "__main__":
 
     ga_instance = pygad.GA(num_generations=50,
                         num_parents_mating=4,
-                        fitness_func=fitness_func,
+                        fitness_func=fitness_batch_func,
                         sol_per_pop=sol_per_pop,
                         num_genes=NUM_GA_POINTS * 3, #XYZ,
                         mutation_percent_genes=10,
-                        fitness_batch_size=1,#execute one test at a time
+                        fitness_batch_size=sol_per_pop, #whole generation at once
                         init_range_high=500,
                         init_range_low=-500,
                         initial_population=initial_population,
+                        on_generation=on_new_generation,
                         ) 
-    ga_instance.run()
\ No newline at end of file
+    ga_instance.run()
+    EVALUATION.close()
+    print(f"GA evaluation: {EVALUATION.stats()}")
+    print(profiling.CAMPAIGN.report())
\ No newline at end of file
@@ -2,34 +2,57 @@ from roads import OSMRoad, Road
 from beamng_test_case import BeamNGTestCase
 from pathlib import Path
 import json
-from beamng_executor import BeamNGExecutor
+from ga_evaluation import GAEvaluation
+from postprocess import METRICS_VERSION, oob_score
+import profiling
+from oracles import progress_oracles
 import time
-import random
 import pygad
 import numpy as np
+from osm_cache import OSMRoadCache
+from osm_index import StreetIndex
+from elevation import ElevationService, OpenTopoDataBackend
+from road_features import RoadFeatures
+from diversity import DiversitySelector
 
 MAIN_DIR = Path('C:\\Users\\tupol\\Documents\\Dissertation')
 BEAMNG_USER_PATH = MAIN_DIR / 'beamng_user' / '0.21'
 BEAMNG_HOME_PATH = MAIN_DIR / 'BeamNG.tech.v0.21.3.0'
 ROAD_FILE_PATH = BEAMNG_USER_PATH / 'levels' / "smallgrid" / 'main' / 'MissionGroup' / 'Roads' / 'items.level.json'
 RESULTS_PATH = Path('results') / 'ga_osm'
+FITNESS_CACHE_PATH = Path('cache') / 'fitness_ga_osm.sqlite'
+OSM_CACHE_PATH = Path('cache') / 'osm'
+STREET_INDEX_PATH = Path('cache') / 'street_index.npz'
+ROAD_FEATURES_PATH = Path('cache') / 'road_features.npz'
 MAX_SPEED = 13.4112 # 30mph Uk speed limit for residential roads
 MAX_ROAD_LENGTH = 2000 #meters
 MIN_ROAD_LENGTH = 100 #meters
 NUM_GA_POINTS = 10
 
+#"beamng" or "kinematic", the kinematic one runs headless without BeamNG installed
+SIMULATOR = "beamng"
+#deterministic BeamNG advanced by fixed physics steps per tick, reproducible fitness, not tied to real time
+STEPPED = True
+#stop hopeless runs (stuck, not moving along the road) before the time budget, see oracles.py
+#out of bounds oracles are not used, score() rewards runs reaching the goal with much oob
+ORACLES = progress_oracles()
+#phase to run under cProfile, e.g. "tick_loop", stats are written to profiles/
+PROFILE_PHASE = None
+if PROFILE_PHASE is not None:
+    profiling.enable_cprofile(PROFILE_PHASE)
 #evaluates execution
 def score(execution_data: dict) -> float:
     if not execution_data['success']:
         return -1
     
-    oobs = execution_data['out_of_bounds']
-    length = execution_data['length']
-    OOBS_RATION_VALUE = 100
-    score = (sum(oobs) / length) * OOBS_RATION_VALUE
-    return score
+    return oob_score(execution_data['out_of_bounds'], execution_data['length'])
 
-def fitness_func(ga_instance, solution, solution_idx):
+#version of score(), bump when it changes so cached fitness is not reused,
+#changes of the oob score formula are covered by METRICS_VERSION
+SCORE_VERSION = 1
+
+def build_test(ga_instance, solution, solution_idx):
+    '''Returns test case for the solution, or None if the road is not valid'''
     gen_counter = ga_instance.generations_completed
     test_name = f"GA road {gen_counter}-{solution_idx}"
 
@@ -42,18 +65,32 @@ def fitness_func(ga_instance, solution, solution_idx):
     
     test = BeamNGTestCase(road, ROAD_FILE_PATH, max_speed=MAX_SPEED, visualise=False)
     if not test.is_valid():
-        return -1
-    
-    BeamNGExecutor(beamng_home=BEAMNG_HOME_PATH,
-                beamng_user=BEAMNG_USER_PATH,
-                results_dir=RESULTS_PATH,
-                test_case=test,
-                ai_on=True).execute()
-    
-    fitness = score(test.execution_data)
-    print(f"Fitness value: {fitness}")
-    return fitness
-    
+        return None
+    return test
+
+#screen every generation with a surrogate, simulate only the top quarter,
+#off by default as screened candidates get estimated rather than simulated fitness
+MULTI_FIDELITY = False
+#simulators evaluating a generation concurrently, each with own copy of user dir
+N_WORKERS = 1
+EVALUATION = GAEvaluation(build_test, score,
+                          results_dir=RESULTS_PATH,
+                          fitness_cache_path=FITNESS_CACHE_PATH,
+                          settings={'max_speed': MAX_SPEED, 'score_version': SCORE_VERSION,
+                                    'metrics_version': METRICS_VERSION},
+                          simulator=SIMULATOR,
+                          stepped=STEPPED,
+                          oracles=ORACLES,
+                          pool_kwargs={'beamng_home': BEAMNG_HOME_PATH,
+                                       'user_root': MAIN_DIR / 'beamng_user' / 'pool',
+                                       'n_instances': N_WORKERS,
+                                       'user_template': BEAMNG_USER_PATH},
+                          multi_fidelity=MULTI_FIDELITY,
+                          promote_fraction=0.25)
+
+def fitness_batch_func(ga_instance, solutions, solutions_idx):
+    '''Whole generation at once, see GAEvaluation'''
+    return EVALUATION.evaluate(ga_instance, solutions, solutions_idx)
 
 def initial_osm_population(path, k): #returns array of sol_per_pop arrays, each innter array has #NUM_GA_POINTS * 3 poins
     with open(path, "r") as f:
@@ -61,19 +98,30 @@ def initial_osm_population(path, k): #returns array of sol_per_pop arrays, each
 
     bbox = test_cases['bbox']
     streets = test_cases['streets']
-    random_streets = random.sample(streets, k)
     initial_pop = []
-    for street in random_streets:
+    cache = OSMRoadCache(OSM_CACHE_PATH)
+    street_index = StreetIndex.load_or_ingest(STREET_INDEX_PATH, bbox)
+    #geometrically diverse initial population instead of random streets
+    selector = DiversitySelector(RoadFeatures.load_or_compute(ROAD_FEATURES_PATH, street_index), candidates=streets)
+    diverse_streets = selector.select(k)
+    print(f"Test selection: {selector.coverage()}")
+    elevation = ElevationService(OpenTopoDataBackend(OSMRoad.ELEVATION_DATASET))
+    elevation.prefetch([street_index.get(s) for s in diverse_streets
+                        if s in street_index and not cache.contains(bbox, s, elevation.dataset)])
+    for street in diverse_streets:
         #generate a road that has NUM_GA_POINTS
-        road = OSMRoad(bbox=bbox, street_name=street, max_points=NUM_GA_POINTS)
+        road = OSMRoad(bbox=bbox, street_name=street, max_points=NUM_GA_POINTS,
+                       cache=cache, street_index=street_index, elevation=elevation)
         initial_road = road.points.flatten().tolist()
         initial_pop.append(initial_road)
 
+    print(f"OSM cache: {cache.stats()}")
     return initial_pop
 
 def on_new_generation(ga_instance):
     print("Generation : ", ga_instance.generations_completed)
     print("Fitness of the best solution :", ga_instance.best_solution()[1])
+    print("Fitness cache :", EVALUATION.fitness_cache.generation_stats())
 
 if __name__ == "__main__":
 
@@ -83,12 +131,15 @@ if __name__ == "__main__":
 
     ga_instance = pygad.GA(num_generations=50,
                         num_parents_mating=sol_per_pop//2,
-                        fitness_func=fitness_func,
+                        fitness_func=fitness_batch_func,
                         sol_per_pop=sol_per_pop,
                         num_genes=NUM_GA_POINTS * 3, #XYZ,
                         mutation_percent_genes=10,
-                        fitness_batch_size=1, #execute one test at a time
+                        fitness_batch_size=sol_per_pop, #whole generation at once
                         initial_population=initial_population,
                         on_generation=on_new_generation,
                         ) 
-    ga_instance.run()
\ No newline at end of file
+    ga_instance.run()
+    EVALUATION.close()
+    print(f"GA evaluation: {EVALUATION.stats()}")
+    print(profiling.CAMPAIGN.report())
\ No newline at end of file
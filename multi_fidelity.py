@@ -0,0 +1,147 @@
+import numpy as np
+from roads import Road
+from beamng_test_case import BeamNGTestCase
+from kinematic_executor import KinematicExecutor
+from road_features import FEATURE_NAMES, road_features
+
+
+#columns of road_features the surrogate is fitted on
+SURROGATE_FEATURES = ['length', 'mean_curvature', 'max_curvature', 'total_turn', 'mean_grade', 'max_grade']
+_SURROGATE_COLUMNS = [FEATURE_NAMES.index(f) for f in SURROGATE_FEATURES]
+INVALID_FITNESS = -1 #fitness of invalid roads and failed runs
+
+
+def geometric_features(road: Road) -> np.ndarray:
+    '''Cheap description of a road: length, curvature and elevation grade'''
+    return road_features([road.points])[0, _SURROGATE_COLUMNS]
+
+
+def geometric_features_batch(roads: list) -> np.ndarray:
+    '''Same as geometric_features for a whole generation in one pass'''
+    return road_features([road.points for road in roads])[:, _SURROGATE_COLUMNS]
+
+
+def kinematic_rollout_score(test: BeamNGTestCase, score) -> float:
+    '''Runs the road in the headless kinematic simulator, results are not saved'''
+    rollout = BeamNGTestCase(test.road, test.file_path, interval=test.interval, max_speed=test.max_speed)
+    KinematicExecutor(results_dir=None, test_case=rollout, ai_on=True, verbose=False).execute()
+    return score(rollout.execution_data)
+
+
+class GeometricSurrogate:
+    '''
+        Ridge regression from road features to simulator fitness,
+        refitted on every simulator result gathered so far.
+    '''
+
+    MIN_SAMPLES = 8 #until then every candidate is simulated
+    RIDGE = 1e-3
+
+    def __init__(self) -> None:
+        self.features = []
+        self.fitness = []
+        self.weights = None
+
+    @property
+    def calibrated(self) -> bool:
+        return self.weights is not None
+
+    def add(self, features: np.ndarray, fitness: float):
+        self.features.append(features)
+        self.fitness.append(fitness)
+
+    def fit(self):
+        if len(self.fitness) < self.MIN_SAMPLES:
+            return
+
+        X = np.array(self.features)
+        self.mean = X.mean(axis=0)
+        self.std = X.std(axis=0)
+        self.std[self.std == 0] = 1
+        X = np.column_stack((np.ones(len(X)), (X - self.mean) / self.std))
+        y = np.array(self.fitness)
+
+        A = X.T @ X + self.RIDGE * np.eye(X.shape[1])
+        self.weights = np.linalg.solve(A, X.T @ y)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        X = np.atleast_2d(features)
+        X = np.column_stack((np.ones(len(X)), (X - self.mean) / self.std))
+        return X @ self.weights
+
+
+class MultiFidelityEvaluator:
+    '''
+        Scores a generation of test cases with a cheap surrogate first,
+        only the most promising fraction is run in the simulator.
+        Screened out candidates get the surrogate estimate, capped below
+        the lowest successfully simulated fitness of the generation and
+        kept above INVALID_FITNESS, so they never rank below an invalid road.
+    '''
+
+    def __init__(self, simulate_batch, score=None, promote_fraction=0.25, min_promoted=1, kinematic_rollout=False) -> None:
+        self.simulate_batch = simulate_batch #list of test cases -> list of fitness, full fidelity
+        self.score = score #execution data -> fitness, needed for kinematic rollout
+        self.promote_fraction = promote_fraction
+        self.min_promoted = min_promoted
+        self.kinematic_rollout = kinematic_rollout
+        self.surrogate = GeometricSurrogate()
+
+        self.simulated = 0
+        self.screened = 0
+        self.last_simulated = [] #which candidates of the last evaluate() call got simulated
+
+    def features(self, tests: list) -> np.ndarray:
+        features = geometric_features_batch([t.road for t in tests])
+        if self.kinematic_rollout:
+            rollouts = [kinematic_rollout_score(t, self.score) for t in tests]
+            features = np.column_stack((features, rollouts))
+        return features
+
+    def evaluate(self, tests: list) -> list:
+        if len(tests) == 0:
+            self.last_simulated = []
+            return []
+
+        features = self.features(tests)
+
+        if self.surrogate.calibrated:
+            predicted = self.surrogate.predict(features)
+            n_promoted = max(self.min_promoted, int(np.ceil(len(tests) * self.promote_fraction)))
+            promoted = set(np.argsort(-predicted)[:n_promoted].tolist())
+        else:
+            predicted = np.zeros(len(tests))
+            promoted = set(range(len(tests)))
+
+        fitness = [None] * len(tests)
+        promoted_order = sorted(promoted)
+        simulated = self.simulate_batch([tests[i] for i in promoted_order])
+        for i, f in zip(promoted_order, simulated):
+            fitness[i] = f
+            self.surrogate.add(features[i], f)
+        self.simulated += len(promoted)
+
+        #strictly between the invalid sentinel and the simulated ones, a screened candidate never ties with either
+        floor = np.nextafter(INVALID_FITNESS, 0)
+        successful = [fitness[i] for i in promoted if fitness[i] > INVALID_FITNESS]
+        cap = np.nextafter(min(successful), -np.inf) if successful else np.inf
+        for i in range(len(tests)):
+            if fitness[i] is None:
+                fitness[i] = float(max(min(predicted[i], cap), floor))
+                self.screened += 1
+
+        self.last_simulated = [i in promoted for i in range(len(tests))]
+        self.surrogate.fit()
+        return fitness
+
+    def stats(self) -> dict:
+        return {
+            'simulated': self.simulated,
+            'screened': self.screened,
+            'calibrated': self.surrogate.calibrated,
+            'samples': len(self.surrogate.fitness),
+        }
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
@@ -0,0 +1,88 @@
+import numpy as np
+import shapely
+from shapely import STRtree
+from roads import Road
+
+
+class OOBEngine:
+    '''
+        Out of bounds ratio of a car footprint against the right lane.
+        The lane is split into one quad per road segment, indexed in an STRtree,
+        so a footprint is clipped only against the few segments around it
+        and the cost does not grow with the road length.
+    '''
+
+    def __init__(self, road: Road) -> None:
+        centre = road.points[:, 0:2]
+        right = road.right_edge[:, 0:2]
+
+        #segment i is c_i, c_i+1, r_i+1, r_i, together they tile the lane polygon
+        quads = np.stack((centre[:-1], centre[1:], right[1:], right[:-1]), axis=1)
+        segments = shapely.polygons(quads)
+
+        #on sharp bends the inner edge can fold over itself
+        invalid = ~shapely.is_valid(segments)
+        if invalid.any():
+            segments[invalid] = shapely.make_valid(segments[invalid])
+
+        self.segments = segments
+        shapely.prepare(self.segments)
+        self.tree = STRtree(self.segments)
+
+    @staticmethod
+    def footprints_to_polygons(footprints) -> np.ndarray:
+        '''(N, 4, 2 or 3) array of footprint corners to N polygons, height is ignored'''
+        footprints = np.asarray(footprints, dtype=np.float64)
+        return shapely.polygons(footprints[..., 0:2])
+
+    def oob_ratio(self, footprint) -> float:
+        '''footprint is a shapely Polygon or (4, 2 or 3) array of corners'''
+        if isinstance(footprint, shapely.Polygon):
+            car = footprint
+        else:
+            car = self.footprints_to_polygons(footprint)
+
+        candidates = self.tree.query(car)
+        return self._clip(car, candidates)
+
+    def oob_ratios(self, footprints) -> np.ndarray:
+        '''OOB ratio for a whole (N, 4, 2 or 3) array of car footprints in one call'''
+        cars = self.footprints_to_polygons(footprints)
+        ratios = np.ones(len(cars))
+        if len(cars) == 0:
+            return ratios
+
+        car_idx, segment_idx = self.tree.query(cars)
+
+        #fast path, car fully inside one segment
+        inside = shapely.contains(self.segments[segment_idx], cars[car_idx])
+        fully_inside = np.zeros(len(cars), dtype=bool)
+        fully_inside[car_idx[inside]] = True
+        ratios[fully_inside] = 0.0
+
+        order = np.argsort(car_idx, kind='stable')
+        car_idx = car_idx[order]
+        segment_idx = segment_idx[order]
+        splits = np.flatnonzero(np.diff(car_idx)) + 1
+        for cars_group, segments_group in zip(np.split(car_idx, splits), np.split(segment_idx, splits)):
+            i = cars_group[0]
+            if not fully_inside[i]:
+                ratios[i] = self._clip(cars[i], segments_group)
+
+        return ratios
+
+    def _clip(self, car, candidates) -> float:
+        if len(candidates) == 0:
+            return 1.0
+
+        nearby = self.segments[candidates]
+        if shapely.contains(nearby, car).any():
+            return 0.0
+
+        lane = shapely.union_all(nearby)
+        inside = shapely.intersection(car, lane).area
+        return max(0.0, 1 - inside / car.area)
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
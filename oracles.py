@@ -0,0 +1,144 @@
+from collections import deque
+import numpy as np
+import shapely
+
+
+class Oracle:
+    '''
+        Decides on every tick whether a run is hopeless and can stop before the time budget.
+        Configured once and copied for every run, per run state is set in reset.
+    '''
+
+    FINISH = "Stopped"
+
+    def __init__(self, grace: float = 0.0) -> None:
+        self.grace = grace #seconds after start the oracle does not stop the run
+
+    def reset(self, executor):
+        pass
+
+    def observe(self, executor, elapsed: float) -> bool:
+        '''Called every tick once the grace period is over, True stops the run'''
+        raise NotImplementedError
+
+    def config(self) -> dict:
+        '''Settings identifying the oracle, e.g. for fitness cache keys'''
+        return {'oracle': type(self).__name__, **{k: v for k, v in vars(self).items() if not k.startswith('_')}}
+
+
+class _WindowOracle(Oracle):
+    '''Keeps (elapsed, value) of the last seconds of the run'''
+
+    def __init__(self, seconds: float, grace: float = 0.0) -> None:
+        super().__init__(grace)
+        self.seconds = seconds
+
+    def reset(self, executor):
+        self._window = deque()
+
+    def _push(self, elapsed: float, value) -> bool:
+        '''Adds value, True once the window spans the whole period'''
+        self._window.append((elapsed, value))
+        while len(self._window) > 1 and self._window[1][0] <= elapsed - self.seconds:
+            self._window.popleft()
+        return elapsed - self._window[0][0] >= self.seconds
+
+
+class Stall(_WindowOracle):
+    '''Car moved less than min_distance in the last seconds, e.g. stuck or stopped'''
+
+    FINISH = "Stalled"
+
+    def __init__(self, seconds: float = 5.0, min_distance: float = 1.0, grace: float = 5.0) -> None:
+        super().__init__(seconds, grace)
+        self.min_distance = min_distance #meters
+
+    def observe(self, executor, elapsed: float) -> bool:
+        centre = executor.footprint[:, 0:2].mean(axis=0)
+        if not self._push(elapsed, centre):
+            return False
+        return bool(np.hypot(*(centre - self._window[0][1])) < self.min_distance)
+
+
+class FullyOutOfBounds(Oracle):
+    '''Car completely off the road for the last seconds'''
+
+    FINISH = "Fully out of bounds"
+
+    def __init__(self, seconds: float = 3.0, threshold: float = 0.99, grace: float = 0.0) -> None:
+        super().__init__(grace)
+        self.seconds = seconds
+        self.threshold = threshold
+
+    def reset(self, executor):
+        self._since = None #elapsed when the car left the road
+
+    def observe(self, executor, elapsed: float) -> bool:
+        if executor.current_oob() < self.threshold:
+            self._since = None
+            return False
+        if self._since is None:
+            self._since = elapsed
+        return elapsed - self._since >= self.seconds
+
+
+class NoProgress(_WindowOracle):
+    '''
+        Furthest point reached along the road did not advance by min_progress
+        in the last seconds, e.g. the car turned back or drives in circles
+    '''
+
+    FINISH = "No progress"
+
+    def __init__(self, seconds: float = 10.0, min_progress: float = 5.0, grace: float = 5.0) -> None:
+        super().__init__(seconds, grace)
+        self.min_progress = min_progress #meters of road arc length
+
+    def reset(self, executor):
+        super().reset(executor)
+        self._line = executor.test_case.road.line_string
+        self._best = -np.inf
+
+    def observe(self, executor, elapsed: float) -> bool:
+        centre = executor.footprint[:, 0:2].mean(axis=0)
+        progress = self._line.project(shapely.Point(centre))
+        self._best = max(self._best, progress)
+        if not self._push(elapsed, self._best):
+            return False
+        return self._best - self._window[0][1] < self.min_progress
+
+
+class CumulativeOutOfBounds(Oracle):
+    '''Car spent limit seconds out of bounds in total (oob ratio integrated over time)'''
+
+    FINISH = "Out of bounds limit"
+
+    def __init__(self, limit: float = 15.0, grace: float = 0.0) -> None:
+        super().__init__(grace)
+        self.limit = limit #seconds fully out of bounds
+
+    def reset(self, executor):
+        self._total = 0.0
+        self._last = None
+
+    def observe(self, executor, elapsed: float) -> bool:
+        if self._last is not None:
+            self._total += executor.current_oob() * (elapsed - self._last)
+        self._last = elapsed
+        return self._total >= self.limit
+
+
+def default_oracles() -> list:
+    return [Stall(), FullyOutOfBounds(), NoProgress(), CumulativeOutOfBounds()]
+
+
+def progress_oracles() -> list:
+    '''
+        Only the oracles stopping a car that does not get anywhere. Out of bounds ones are left out
+        where a run leaving the road but reaching the goal is the wanted outcome, e.g. GA fitness.
+    '''
+    return [Stall(), NoProgress()]
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
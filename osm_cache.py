@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+
+
+class OfflineCacheMiss(Exception):
+    '''Raised when a road is not cached and the cache is offline'''
+
+
+class OSMRoadCache:
+    '''
+        On-disk cache of downloaded OSM streets.
+        Each entry is the merged way geometry with per point elevation
+        (lon, lat, elevation), keyed by (bbox, street name, dataset).
+        Least recently used entries are evicted once the cache is bigger
+        than max_size_bytes. Safe to share between threads preparing roads.
+    '''
+
+    FILE_SUFFIX = ".npy"
+
+    def __init__(self, cache_dir: Path, max_size_bytes: int = 512 * 1024**2, offline: bool = False) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+        self.offline = offline
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._entries = self._scan()
+        self._lock = threading.Lock() #guards _entries and counters, not held while fetching
+
+    @property
+    def size_bytes(self):
+        return sum(self._entries.values())
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'size_bytes': self.size_bytes,
+        }
+
+    @classmethod
+    def key(cls, bbox, street_name: str, dataset: str) -> str:
+        payload = json.dumps([[round(c, 6) for c in bbox], street_name, dataset])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def contains(self, bbox, street_name: str, dataset: str) -> bool:
+        return self.key(bbox, street_name, dataset) in self._entries
+
+    def get(self, bbox, street_name: str, dataset: str):
+        '''Returns cached (lon, lat, elevation) points or None'''
+        key = self.key(bbox, street_name, dataset)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+
+            path = self._path(key)
+            try:
+                points = np.load(path)
+            except (OSError, ValueError):
+                #file removed or corrupted behind our back
+                self._forget(key)
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touch(key)
+            return points
+
+    def put(self, bbox, street_name: str, dataset: str, points: np.ndarray):
+        key = self.key(bbox, street_name, dataset)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp" + self.FILE_SUFFIX)
+        np.save(tmp_path, np.asarray(points, dtype=np.float64))
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._entries[key] = path.stat().st_size
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def get_or_fetch(self, bbox, street_name: str, dataset: str, fetch):
+        '''
+            Returns cached points, on miss calls fetch() and stores its result.
+            In offline mode a miss raises OfflineCacheMiss instead of fetching.
+        '''
+        points = self.get(bbox, street_name, dataset)
+        if points is not None:
+            return points
+
+        if self.offline:
+            raise OfflineCacheMiss(f"{street_name} ({dataset}) is not cached")
+
+        points = fetch()
+        self.put(bbox, street_name, dataset, points)
+        return points
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._forget(key)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.FILE_SUFFIX}"
+
+    def _scan(self) -> OrderedDict:
+        '''Rebuilds LRU order from file modification times'''
+        files = [p for p in self.cache_dir.glob(f"*{self.FILE_SUFFIX}")
+                 if not p.name.endswith(".tmp" + self.FILE_SUFFIX)]
+        stats = [(p.stem, p.stat()) for p in files]
+        stats.sort(key=lambda s: s[1].st_mtime)
+        return OrderedDict((key, st.st_size) for key, st in stats)
+
+    def _touch(self, key: str):
+        self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def _forget(self, key: str):
+        self._entries.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        total = self.size_bytes
+        while total > self.max_size_bytes and len(self._entries) > 1:
+            key, size = next(iter(self._entries.items()))
+            self._forget(key)
+            total -= size
+            self.evictions += 1
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
@@ -0,0 +1,166 @@
+import json
+from pathlib import Path
+import numpy as np
+from OSMPythonTools.overpass import overpassQueryBuilder, Overpass
+from shapely import MultiLineString, LineString, line_merge
+
+
+def way_geometry(geom) -> np.ndarray:
+    points = [(point['lon'], point['lat']) for point in geom]
+    return np.array(points)
+
+
+def merge_ways(way_geometries: list) -> np.ndarray:
+    '''
+        Merges way geometries of one street into a single line,
+        if the street is split into disconnected parts the longest one is picked
+    '''
+    mls = MultiLineString(way_geometries)
+    mls = line_merge(mls)
+
+    if isinstance(mls, MultiLineString):
+        #pick the longest one
+        lengths = [g.length for g in mls.geoms]
+        longest = np.argmax(lengths)
+        mls = mls.geoms[longest]
+
+    if not isinstance(mls, LineString) or mls.is_empty:
+        raise ValueError("Ways do not form a line")
+
+    return np.array(mls.coords)
+
+
+def split_bbox(bbox, tiles: int) -> list:
+    #bbox is (south, west, north, east)
+    south, west, north, east = bbox
+    lats = np.linspace(south, north, tiles + 1).tolist()
+    lons = np.linspace(west, east, tiles + 1).tolist()
+    return [[lats[i], lons[j], lats[i+1], lons[j+1]]
+            for i in range(tiles) for j in range(tiles)]
+
+
+def query_ways(bbox, tiles: int = 1) -> list:
+    '''Overpass way elements with geometry of every named road in the bbox, in tiles x tiles queries'''
+    elements = []
+    overpass = Overpass()
+    for tile in split_bbox(bbox, tiles):
+        query = overpassQueryBuilder(
+            bbox=tile,
+            elementType=['way'],
+            includeGeometry=True,
+            selector=StreetIndex.SELECTOR)
+        elements += overpass.query(query, timeout=600).toJSON()['elements']
+    return elements
+
+
+class StreetIndex:
+    '''
+        Local index from street name to merged (lon, lat) line.
+        Built once from a bbox wide Overpass query, so roads can be
+        created without querying Overpass for every street.
+    '''
+
+    #every named road in the bbox
+    SELECTOR = ['"highway"', '"name"']
+
+    def __init__(self, streets: dict = None) -> None:
+        self.streets = streets if streets is not None else {}
+
+    def __contains__(self, street_name):
+        return street_name in self.streets
+
+    def __len__(self):
+        return len(self.streets)
+
+    @property
+    def names(self):
+        return sorted(self.streets)
+
+    def get(self, street_name: str) -> np.ndarray:
+        if street_name not in self.streets:
+            raise KeyError(f"Street {street_name} not in index")
+        return self.streets[street_name].copy()
+
+    @classmethod
+    def from_elements(cls, elements: list):
+        '''Builds index from Overpass way elements with geometry'''
+        ways_by_name = {}
+        seen_ids = set()
+        for way in elements:
+            if way.get('type', 'way') != 'way' or 'geometry' not in way:
+                continue
+            #tiles overlap on the edges, the same way can be returned twice
+            if way.get('id') in seen_ids:
+                continue
+            seen_ids.add(way.get('id'))
+
+            name = way.get('tags', {}).get('name')
+            if name is None or len(way['geometry']) < 2:
+                continue
+            ways_by_name.setdefault(name, []).append(way_geometry(way['geometry']))
+
+        streets = {}
+        for name, geometries in ways_by_name.items():
+            try:
+                streets[name] = merge_ways(geometries)
+            except ValueError:
+                continue
+        return cls(streets)
+
+    @classmethod
+    def from_overpass_json(cls, path: Path):
+        '''Builds index from a recorded Overpass JSON response'''
+        with open(path, "r") as f:
+            response = json.load(f)
+        return cls.from_elements(response['elements'])
+
+    @classmethod
+    def ingest(cls, bbox, tiles: int = 1, record_path: Path = None):
+        '''
+            Downloads every named way in the bbox, split into tiles x tiles queries.
+            Raw response can be recorded to record_path to rebuild the index offline.
+        '''
+        elements = query_ways(bbox, tiles)
+
+        if record_path is not None:
+            with open(record_path, "w") as f:
+                json.dump({'elements': elements}, f)
+
+        return cls.from_elements(elements)
+
+    @classmethod
+    def load_or_ingest(cls, path: Path, bbox, tiles: int = 1):
+        path = Path(path)
+        if path.exists():
+            return cls.load(path)
+
+        index = cls.ingest(bbox, tiles)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        index.save(path)
+        return index
+
+    def save(self, path: Path):
+        '''Stores all lines in one npz file, concatenated with offsets'''
+        names = self.names
+        lines = [self.streets[name] for name in names]
+        lengths = [len(line) for line in lines]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        coords = np.concatenate(lines) if lines else np.empty((0, 2))
+
+        with open(path, "wb") as f:
+            np.savez(f, names=np.array(names, dtype=str), offsets=offsets, coords=coords)
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path) as data:
+            names = data['names']
+            offsets = data['offsets']
+            coords = data['coords']
+
+        streets = {str(name): coords[offsets[i]:offsets[i+1]]
+                   for i, name in enumerate(names)}
+        return cls(streets)
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
@@ -0,0 +1,90 @@
+import sys
+from pathlib import Path
+import numpy as np
+import shapely
+from roads import Road
+from oob import OOBEngine
+from trajectory import load_execution_data, write_execution_data
+from telemetry import recover_results_dir
+
+#bump when the definition of any metric changes
+METRICS_VERSION = 1
+OOBS_RATION_VALUE = 100
+
+
+def oob_score(out_of_bounds, length: float) -> float:
+    '''Out of bounds ratio summed over the ticks, per meter of road'''
+    return float(np.sum(out_of_bounds) / length * OOBS_RATION_VALUE)
+
+
+def road_from_execution_data(execution_data: dict) -> Road:
+    return Road(
+        points=np.array(execution_data['points']),
+        width=execution_data.get('road_width', 8),
+        name=execution_data['name'],
+        interpolate=False,
+    )
+
+
+def compute_metrics(execution_data: dict) -> dict:
+    '''
+        Computes metrics of a run from recorded car footprints, positions and velocities.
+        Needs no simulator, so old results can be re-scored.
+    '''
+    footprints = np.array(execution_data['bbox'], dtype=np.float64).reshape(-1, 4, 3)
+    road = road_from_execution_data(execution_data)
+
+    oob = OOBEngine(road).oob_ratios(footprints)
+
+    goal = shapely.Point(execution_data['waypoint_position'])
+    cars = OOBEngine.footprints_to_polygons(footprints)
+    goal_distance = shapely.distance(cars, goal) if len(cars) else np.empty(0)
+
+    velocity = np.array(execution_data['velocity'], dtype=np.float64).reshape(-1, 3)
+    speed = np.linalg.norm(velocity, axis=1)
+
+    summary = {
+        'oob_score': oob_score(oob, execution_data['length']),
+        'max_oob': float(oob.max()) if len(oob) else 0.0,
+        'mean_oob': float(oob.mean()) if len(oob) else 0.0,
+        'ticks_out_of_bounds': int(np.count_nonzero(oob > 0)),
+        'min_goal_distance': float(goal_distance.min()) if len(goal_distance) else None,
+        'average_velocity': float(speed.mean()) if len(speed) else 0.0,
+        'max_velocity': float(speed.max()) if len(speed) else 0.0,
+    }
+
+    return {
+        'out_of_bounds': oob,
+        'goal_distance': goal_distance,
+        'metrics': summary,
+        'metrics_version': METRICS_VERSION,
+    }
+
+
+def rescore_results_dir(results_dir: Path) -> dict:
+    '''
+        Recomputes metrics of every result in the directory in place.
+        Results recorded without car footprints are skipped.
+    '''
+    counts = {'rescored': 0, 'skipped': 0}
+    for path in sorted(Path(results_dir).glob("*.json")):
+        execution_data = load_execution_data(path)
+
+        if 'bbox' not in execution_data or 'waypoint_position' not in execution_data:
+            counts['skipped'] += 1
+            continue
+
+        execution_data.update(compute_metrics(execution_data))
+        #legacy single json results are converted on the way
+        write_execution_data(path, execution_data)
+        counts['rescored'] += 1
+
+    return counts
+
+
+if __name__ == "__main__":
+    #python postprocess.py results/osm results/ga
+    for results_dir in sys.argv[1:]:
+        #partial runs of crashed executions first, so they get rescored too
+        print(f"{results_dir}: {recover_results_dir(Path(results_dir))}")
+        print(f"{results_dir}: {rescore_results_dir(Path(results_dir))}")
@@ -0,0 +1,83 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PreparationPipeline:
+    '''
+        Prepares upcoming test cases in background threads while the current ones run.
+        At most lookahead test cases are being prepared or waiting at any time,
+        so network and geometry work overlaps with simulation without running
+        far ahead of it. Test cases are yielded in the order of items,
+        failed preparations and invalid roads are skipped and never reach the simulator.
+    '''
+
+    LOOKAHEAD = 3
+    N_WORKERS = 2
+
+    def __init__(self, prepare, items, lookahead: int = LOOKAHEAD, n_workers: int = N_WORKERS) -> None:
+        self.prepare = prepare #item -> test case, e.g. street name -> BeamNGTestCase
+        self.items = items
+        self.lookahead = max(1, lookahead)
+        self.n_workers = max(1, n_workers)
+
+        self.prepared = 0
+        self.invalid = 0
+        self.failed = 0
+        self.wait_seconds = 0.0 #consumer blocked because the next test case was not ready
+
+    def _prepare(self, item):
+        test_case = self.prepare(item)
+        if test_case is None or not test_case.is_valid():
+            return None
+        return test_case
+
+    def __iter__(self):
+        items = iter(self.items)
+        futures = deque()
+        executor = ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix="prepare")
+
+        def submit():
+            for item in items:
+                futures.append((item, executor.submit(self._prepare, item)))
+                return
+
+        try:
+            for _ in range(self.lookahead):
+                submit()
+
+            while futures:
+                item, future = futures.popleft()
+                start = time.perf_counter()
+                try:
+                    test_case = future.result()
+                except Exception as e:
+                    print(f"Preparing {item} failed: {e!r}")
+                    test_case = None
+                    self.failed += 1
+                else:
+                    if test_case is None:
+                        print(f"Skipping {item}, invalid road")
+                        self.invalid += 1
+                self.wait_seconds += time.perf_counter() - start
+                submit()
+
+                if test_case is not None:
+                    self.prepared += 1
+                    yield test_case
+        finally:
+            for _, future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            'prepared': self.prepared,
+            'invalid': self.invalid,
+            'failed': self.failed,
+            'wait_seconds': self.wait_seconds,
+        }
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
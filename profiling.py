@@ -0,0 +1,162 @@
+import cProfile
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class Profile:
+    '''
+        Named spans (count and total seconds) and counters.
+        Cheap enough to stay on all the time, a span costs two perf_counter calls.
+    '''
+
+    def __init__(self) -> None:
+        self.spans = {} #name -> [count, total seconds, max seconds]
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, seconds: float):
+        with self._lock:
+            span = self.spans.get(name)
+            if span is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                span[0] += 1
+                span[1] += seconds
+                span[2] = max(span[2], seconds)
+
+    def count(self, name: str, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, snapshot: dict):
+        '''Adds a snapshot, e.g. of one run to a campaign'''
+        with self._lock:
+            for name, s in snapshot.get('spans', {}).items():
+                span = self.spans.setdefault(name, [0, 0.0, 0.0])
+                span[0] += s['count']
+                span[1] += s['total']
+                span[2] = max(span[2], s['max'])
+            for name, n in snapshot.get('counters', {}).items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'spans': {name: {'count': c, 'total': t, 'max': m} for name, (c, t, m) in self.spans.items()},
+                'counters': dict(self.counters),
+            }
+
+    def report(self) -> str:
+        '''Spans sorted by total time, then counters'''
+        snapshot = self.snapshot()
+        spans = sorted(snapshot['spans'].items(), key=lambda s: -s[1]['total'])
+        lines = [f"{'span':<24}{'count':>8}{'total s':>12}{'mean s':>12}{'max s':>12}"]
+        for name, s in spans:
+            lines.append(f"{name:<24}{s['count']:>8}{s['total']:>12.3f}{s['total'] / s['count']:>12.4f}{s['max']:>12.4f}")
+        for name, n in sorted(snapshot['counters'].items()):
+            lines.append(f"{name:<24}{n:>8.1f}" if isinstance(n, float) else f"{name:<24}{n:>8}")
+        return "\n".join(lines)
+
+
+def results_profile(results_dir: Path) -> Profile:
+    '''Campaign report of saved runs, merges profiles of all results in the directory'''
+    profile = Profile()
+    for path in Path(results_dir).glob("*.json"):
+        with open(path, "r") as f:
+            execution_data = json.load(f)
+        if 'profile' in execution_data:
+            profile.merge(execution_data['profile'])
+            profile.count("runs")
+    return profile
+
+
+#whole campaign, every span and counter of every thread ends up here
+CAMPAIGN = Profile()
+
+_local = threading.local()
+
+#optional cProfile of a single phase
+_cprofile_phase = None
+_cprofile_dir = None
+_cprofile_lock = threading.Lock() #one profiler at a time
+_cprofile_runs = 0
+
+
+def _active() -> list:
+    if not hasattr(_local, 'profiles'):
+        _local.profiles = []
+    return _local.profiles
+
+
+@contextmanager
+def collect(profile: Profile):
+    '''Spans and counters of this thread inside the block go to profile as well'''
+    profiles = _active()
+    if any(p is profile for p in profiles):
+        yield profile
+        return
+
+    profiles.append(profile)
+    try:
+        yield profile
+    finally:
+        profiles.remove(profile)
+
+
+def enable_cprofile(phase: str, output_dir: Path = Path("profiles")):
+    '''Runs cProfile during every span named phase, stats go to output_dir/<phase>-<n>.prof'''
+    global _cprofile_phase, _cprofile_dir
+    _cprofile_phase = phase
+    _cprofile_dir = Path(output_dir)
+    _cprofile_dir.mkdir(parents=True, exist_ok=True)
+
+
+@contextmanager
+def _cprofiled(name: str):
+    global _cprofile_runs
+    #other thread is being profiled, this span runs without
+    if name != _cprofile_phase or not _cprofile_lock.acquire(blocking=False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+        profiler.dump_stats(str(_cprofile_dir / f"{name}-{_cprofile_runs}.prof"))
+        _cprofile_runs += 1
+    finally:
+        _cprofile_lock.release()
+
+
+@contextmanager
+def span(name: str):
+    '''Times the block, recorded in the campaign and every profile collected in this thread'''
+    start = time.perf_counter()
+    try:
+        if _cprofile_phase is None:
+            yield
+        else:
+            with _cprofiled(name):
+                yield
+    finally:
+        seconds = time.perf_counter() - start
+        CAMPAIGN.add_span(name, seconds)
+        for profile in _active():
+            profile.add_span(name, seconds)
+
+
+def count(name: str, n=1):
+    CAMPAIGN.count(name, n)
+    for profile in _active():
+        profile.count(name, n)
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import sys
+from pathlib import Path
+import numpy as np
+from postprocess import oob_score
+from trajectory import load_execution_data
+
+
+def avg_velocity(execution_data: dict) -> float:
+    velocity = np.asarray(execution_data['velocity'], dtype=np.float64).reshape(-1, 3)
+    return float(np.linalg.norm(velocity, axis=1).mean()) if len(velocity) else 0.0
+
+
+class ResultsCatalog:
+    '''
+        One row per execution, stored in SQLite so analysis does not re-read result files.
+        Ingestion is incremental, a file is parsed only if it is new or its
+        modification time or size changed (e.g. after rescoring).
+    '''
+
+    COLUMNS = [
+        ('path', 'TEXT PRIMARY KEY'), #result json header
+        ('results_set', 'TEXT'), #e.g. osm, ga
+        ('mtime_ns', 'INTEGER'),
+        ('size', 'INTEGER'),
+        ('name', 'TEXT'),
+        ('length', 'REAL'),
+        ('n_points', 'INTEGER'),
+        ('success', 'INTEGER'),
+        ('finish', 'TEXT'),
+        ('oob_score', 'REAL'),
+        ('avg_velocity', 'REAL'),
+        ('n_ticks', 'INTEGER'),
+        ('launch_time', 'REAL'),
+        ('reload_time', 'REAL'),
+        ('trajectory', 'TEXT'), #raw trajectory .npz, None for old single json results
+    ]
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.row_factory = sqlite3.Row
+        columns = ", ".join(f"{name} {sql_type}" for name, sql_type in self.COLUMNS)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS executions ({columns})")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS executions_set ON executions (results_set)")
+        self.connection.commit()
+
+    def _row(self, path: Path, results_set: str, stat) -> tuple:
+        #footprints are not needed for the summary, skip reading them
+        x = load_execution_data(path, columns=['out_of_bounds', 'velocity'])
+        trajectory = path.with_suffix(".npz")
+        timings = x.get('timings', {})
+        return (
+            str(path),
+            results_set,
+            stat.st_mtime_ns,
+            stat.st_size,
+            x['name'],
+            x['length'],
+            x['n_points'],
+            int(x['success']),
+            x['finish'],
+            oob_score(x['out_of_bounds'], x['length']) if x['success'] else -1,
+            avg_velocity(x),
+            len(x['velocity']),
+            timings.get('launch'),
+            timings.get('reload'),
+            str(trajectory) if trajectory.exists() else None,
+        )
+
+    def ingest(self, results_dir: Path, results_set: str = None) -> dict:
+        '''Adds new and changed results of the directory, removes rows of deleted files'''
+        results_dir = Path(results_dir)
+        results_set = results_set or results_dir.name
+        known = {row['path']: (row['mtime_ns'], row['size']) for row in self.connection.execute(
+            "SELECT path, mtime_ns, size FROM executions WHERE results_set = ?", (results_set,))}
+
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+        rows = []
+        seen = set()
+        with os.scandir(results_dir) as entries:
+            for entry in entries:
+                #*.tmp files are results being written
+                if not entry.name.endswith(".json"):
+                    continue
+                path = str(Path(results_dir) / entry.name)
+                seen.add(path)
+                stat = entry.stat()
+                if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                    counts['unchanged'] += 1
+                    continue
+                counts['updated' if path in known else 'added'] += 1
+                rows.append(self._row(Path(path), results_set, stat))
+
+        removed = [(path,) for path in known if path not in seen]
+        counts['removed'] = len(removed)
+
+        placeholders = ", ".join("?" * len(self.COLUMNS))
+        with self.connection:
+            self.connection.executemany(f"INSERT OR REPLACE INTO executions VALUES ({placeholders})", rows)
+            self.connection.executemany("DELETE FROM executions WHERE path = ?", removed)
+        return counts
+
+    def query(self, where: str = None, params=(), columns=None, order_by: str = None, limit: int = None) -> list:
+        '''
+            Rows as dicts, where is an SQL condition with ? placeholders, e.g.
+            query("results_set = ? AND success", ("osm",), order_by="oob_score DESC")
+        '''
+        sql = f"SELECT {', '.join(columns) if columns else '*'} FROM executions"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def aggregate(self, group_by: str = "results_set", where: str = None, params=()) -> list:
+        '''Number of runs, success rate and mean metrics per group'''
+        sql = f"""SELECT {group_by},
+                COUNT(*) AS runs,
+                AVG(success) AS success_rate,
+                AVG(CASE WHEN success THEN oob_score END) AS mean_oob_score,
+                MAX(oob_score) AS max_oob_score,
+                AVG(avg_velocity) AS mean_velocity,
+                AVG(launch_time) AS mean_launch_time,
+                AVG(reload_time) AS mean_reload_time
+            FROM executions"""
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" GROUP BY {group_by}"
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def dataframe(self, where: str = None, params=(), columns=None, order_by: str = None):
+        '''Same as query() as a pandas DataFrame, pandas is needed only here'''
+        import pandas as pd
+        return pd.DataFrame(self.query(where, params, columns, order_by),
+                            columns=columns or [name for name, _ in self.COLUMNS])
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM executions").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    #python results_catalog.py results/osm results/ga
+    catalog = ResultsCatalog(Path("cache") / "results.sqlite")
+    for results_dir in sys.argv[1:]:
+        print(f"{results_dir}: {catalog.ingest(Path(results_dir))}")
+    for group in catalog.aggregate():
+        print(group)
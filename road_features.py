@@ -0,0 +1,234 @@
+from pathlib import Path
+import numpy as np
+from osm_index import StreetIndex
+
+#turns below this count as going straight, meters of such segments form a straight run
+STRAIGHT_TURN = np.radians(5)
+MIN_STRAIGHT = 50 #meters, shorter runs do not count to straight_fraction
+SHARP_TURN = np.radians(30)
+PROFILE_BINS = 16 #curvature profile along the road, bins of equal arc length
+
+SUMMARY_FEATURES = [
+    'length',
+    'n_points',
+    'sinuosity', #length / distance between the ends
+    'mean_curvature', #rad/m, weighted by length
+    'max_curvature',
+    'curvature_std',
+    'total_turn', #rad, sum of absolute turn angles
+    'mean_turn',
+    'max_turn',
+    'sharp_turns',
+    'turn_balance', #-1 only right turns, 1 only left turns
+    'longest_straight', #meters
+    'straight_fraction',
+    'mean_grade', #weighted by length, 0 without elevation
+    'max_grade',
+    'elevation_range',
+]
+FEATURE_NAMES = SUMMARY_FEATURES + [f'curvature_profile_{i}' for i in range(PROFILE_BINS)]
+
+
+def project_lonlat(coords: np.ndarray, road: np.ndarray, n_roads: int) -> np.ndarray:
+    '''(lon, lat) of many roads to meters around the centre of each road, as OSMRoad does'''
+    LAT_DEGREE_IN_METERS = 111.2 * 1000
+    EARTH_RADIUS_IN_METERS = 6371 * 1000
+
+    counts = np.maximum(np.bincount(road, minlength=n_roads), 1)
+    mean_lon = np.bincount(road, coords[:, 0], minlength=n_roads) / counts
+    mean_lat = np.bincount(road, coords[:, 1], minlength=n_roads) / counts
+    lon_degree = (np.pi / 180) * EARTH_RADIUS_IN_METERS * np.cos(np.deg2rad(mean_lat))
+
+    projected = np.array(coords, dtype=np.float64)
+    projected[:, 0] = (coords[:, 0] - mean_lon[road]) * lon_degree[road]
+    projected[:, 1] = (coords[:, 1] - mean_lat[road]) * LAT_DEGREE_IN_METERS
+    return projected
+
+
+def _group_max(values: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    out = np.zeros(n_groups)
+    np.maximum.at(out, groups, values)
+    return out
+
+
+def _divide(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.divide(a, b, out=np.zeros_like(a, dtype=np.float64), where=b > 0)
+
+
+def ragged_features(points: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    '''
+        Features of many roads in one pass. points is the concatenation of all roads,
+        (N, 2 or 3) in meters, road i is points[offsets[i]:offsets[i+1]].
+        Returns (n_roads, len(FEATURE_NAMES)) matrix.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    if points.shape[1] == 2:
+        points = np.column_stack((points, np.zeros(len(points))))
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_roads = len(offsets) - 1
+    n_points = np.diff(offsets)
+    road = np.repeat(np.arange(n_roads), n_points)
+
+    #segments inside a road, the ones joining two roads are dropped
+    same = road[:-1] == road[1:]
+    delta = np.diff(points, axis=0)[same]
+    seg_road = road[:-1][same]
+    horizontal = np.hypot(delta[:, 0], delta[:, 1])
+    length = np.bincount(seg_road, horizontal, minlength=n_roads)
+
+    has_points = n_points > 0
+    first = points[offsets[:-1][has_points]]
+    last = points[offsets[1:][has_points] - 1]
+    ends = np.zeros(n_roads)
+    ends[has_points] = np.hypot(*(last - first)[:, 0:2].T)
+    sinuosity = _divide(length, ends)
+
+    #turns between consecutive segments of the same road
+    heading = np.arctan2(delta[:, 1], delta[:, 0])
+    same_turn = seg_road[:-1] == seg_road[1:]
+    turn = np.angle(np.exp(1j * np.diff(heading)))[same_turn]
+    turn_road = seg_road[:-1][same_turn]
+    turn_length = ((horizontal[:-1] + horizontal[1:]) / 2)[same_turn]
+    abs_turn = np.abs(turn)
+    curvature = _divide(abs_turn, turn_length)
+
+    n_turns = np.bincount(turn_road, minlength=n_roads)
+    turn_weight = np.bincount(turn_road, turn_length, minlength=n_roads)
+    total_turn = np.bincount(turn_road, abs_turn, minlength=n_roads)
+    mean_curvature = _divide(np.bincount(turn_road, curvature * turn_length, minlength=n_roads), turn_weight)
+    curvature_sq = _divide(np.bincount(turn_road, curvature**2 * turn_length, minlength=n_roads), turn_weight)
+    curvature_std = np.sqrt(np.maximum(curvature_sq - mean_curvature**2, 0))
+    turn_balance = _divide(np.bincount(turn_road, turn, minlength=n_roads), total_turn)
+
+    #straight runs, broken by a turn or by the start of a new road
+    breaks = np.ones(len(delta), dtype=bool)
+    breaks[1:] = ~same_turn
+    breaks[np.flatnonzero(same_turn) + 1] = abs_turn >= STRAIGHT_TURN
+    run = np.cumsum(breaks) - 1
+    run_length = np.bincount(run, horizontal)
+    run_road = seg_road[breaks]
+    longest_straight = _group_max(run_length, run_road, n_roads)
+    straight = run_length * (run_length >= MIN_STRAIGHT)
+    straight_fraction = _divide(np.bincount(run_road, straight, minlength=n_roads), length)
+
+    #grades
+    grade = _divide(np.abs(delta[:, 2]), horizontal)
+    mean_grade = _divide(np.bincount(seg_road, grade * horizontal, minlength=n_roads), length)
+    z_max = np.full(n_roads, -np.inf)
+    z_min = np.full(n_roads, np.inf)
+    np.maximum.at(z_max, road, points[:, 2])
+    np.minimum.at(z_min, road, points[:, 2])
+    elevation_range = np.where(has_points, z_max - z_min, 0)
+
+    #curvature profile, turn per meter in bins of equal arc length
+    arc = np.cumsum(horizontal) - np.repeat(np.concatenate(([0], np.cumsum(length)[:-1])), np.bincount(seg_road, minlength=n_roads))
+    turn_arc = arc[:-1][same_turn] #arc length at the vertex of the turn
+    bins = np.clip((_divide(turn_arc, length[turn_road]) * PROFILE_BINS).astype(np.int64), 0, PROFILE_BINS - 1)
+    profile = np.bincount(turn_road * PROFILE_BINS + bins, abs_turn, minlength=n_roads * PROFILE_BINS)
+    profile = _divide(profile.reshape(n_roads, PROFILE_BINS), (length / PROFILE_BINS)[:, None])
+
+    summary = np.column_stack((
+        length,
+        n_points,
+        sinuosity,
+        mean_curvature,
+        _group_max(curvature, turn_road, n_roads),
+        curvature_std,
+        total_turn,
+        _divide(total_turn, n_turns),
+        _group_max(abs_turn, turn_road, n_roads),
+        np.bincount(turn_road, abs_turn >= SHARP_TURN, minlength=n_roads),
+        turn_balance,
+        longest_straight,
+        straight_fraction,
+        mean_grade,
+        _group_max(grade, seg_road, n_roads),
+        elevation_range,
+    ))
+    return np.column_stack((summary, profile))
+
+
+def road_features(point_arrays: list) -> np.ndarray:
+    '''Features of a batch of road point arrays in meters, e.g. [road.points for road in roads]'''
+    if len(point_arrays) == 0:
+        return np.empty((0, len(FEATURE_NAMES)))
+    offsets = np.concatenate(([0], np.cumsum([len(p) for p in point_arrays])))
+    dims = max(np.shape(p)[1] for p in point_arrays)
+    points = np.concatenate([np.column_stack((p, np.zeros((len(p), dims - np.shape(p)[1])))) for p in point_arrays])
+    return ragged_features(points, offsets)
+
+
+class RoadFeatures:
+    '''Feature matrix of named roads, one row per road, persisted to npz'''
+
+    def __init__(self, names: list, features: np.ndarray) -> None:
+        self.names = list(names)
+        self.features = np.asarray(features, dtype=np.float64)
+        self._rows = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def row(self, name: str) -> np.ndarray:
+        return self.features[self._rows[name]]
+
+    def rows(self, names: list) -> np.ndarray:
+        return self.features[[self._rows[name] for name in names]]
+
+    def column(self, feature: str) -> np.ndarray:
+        return self.features[:, FEATURE_NAMES.index(feature)]
+
+    @classmethod
+    def from_street_index(cls, street_index: StreetIndex, elevation=None):
+        '''
+            Every street of the index in one pass. With an ElevationService,
+            grades are computed too, otherwise streets are treated as flat.
+        '''
+        names = street_index.names
+        lines = [street_index.streets[name] for name in names]
+        offsets = np.concatenate(([0], np.cumsum([len(line) for line in lines]))).astype(np.int64)
+        coords = np.concatenate(lines) if lines else np.empty((0, 2))
+
+        road = np.repeat(np.arange(len(names)), np.diff(offsets))
+        points = project_lonlat(coords[:, 0:2], road, len(names))
+        if elevation is not None:
+            z = elevation.elevate(coords[:, 0:2])[:, 2]
+            points = np.column_stack((points, z))
+        return cls(names, ragged_features(points, offsets))
+
+    @classmethod
+    def from_roads(cls, roads: list):
+        return cls([road.name for road in roads], road_features([road.points for road in roads]))
+
+    def save(self, path: Path):
+        with open(path, "wb") as f:
+            np.savez(f, names=np.array(self.names, dtype=str), features=self.features,
+                     feature_names=np.array(FEATURE_NAMES, dtype=str))
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path) as data:
+            if list(data['feature_names']) != FEATURE_NAMES:
+                raise ValueError(f"{path} has features of another version")
+            return cls([str(name) for name in data['names']], data['features'])
+
+    @classmethod
+    def load_or_compute(cls, path: Path, street_index: StreetIndex, elevation=None):
+        path = Path(path)
+        if path.exists():
+            try:
+                return cls.load(path)
+            except ValueError:
+                pass
+
+        road_features = cls.from_street_index(street_index, elevation)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        road_features.save(path)
+        return road_features
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
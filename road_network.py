@@ -0,0 +1,348 @@
+import argparse
+import json
+import time
+from pathlib import Path
+import numpy as np
+from shapely import LineString
+from osm_index import StreetIndex, query_ways, way_geometry
+from road_features import ragged_features, project_lonlat, FEATURE_NAMES
+from roads import Road
+
+#routes are made of whole edges, the last one is cut at the target length
+LENGTH_TOLERANCE = 0.1 #routes shorter than target * (1 - tolerance) are rejected
+MAX_JUNCTION_TURN = np.radians(120) #sharper turns at a junction are not taken, e.g. U-turns
+MAX_ATTEMPTS_PER_ROUTE = 50 #walks per requested route before giving up, e.g. on a tiny network
+
+
+class RoadNetwork:
+    '''
+        Graph of the roads in a bbox, built once and kept in memory.
+        Nodes are junctions and line ends, every edge is the piece of a street
+        between two nodes. Edge geometry is not copied, an edge is a slice
+        [edge_start, edge_end] of the concatenated street coordinates.
+        Streets meet where they share a coordinate, as OSM ways share junction nodes.
+        Build it from the raw ways (from_elements, load_or_ingest), StreetIndex keeps
+        only the longest part of every street and the graph would miss roads.
+    '''
+
+    PRECISION = 6 #decimal places of (lon, lat) identifying a node, ~0.1m
+
+    def __init__(self, names: list, lines: list) -> None:
+        lines = [np.asarray(line, dtype=np.float64)[:, 0:2] for line in lines]
+        keep = [i for i, line in enumerate(lines) if len(line) >= 2]
+        self.street_names = [names[i] for i in keep]
+        lines = [lines[i] for i in keep]
+
+        offsets = np.concatenate(([0], np.cumsum([len(line) for line in lines]))).astype(np.int64)
+        self.line_offsets = offsets #line i is lonlat[line_offsets[i]:line_offsets[i+1]]
+        self.lonlat = np.concatenate(lines) if lines else np.empty((0, 2))
+        line = np.repeat(np.arange(len(lines)), np.diff(offsets))
+
+        #one metric frame for the whole network, lengths and headings are taken in it
+        xy = project_lonlat(self.lonlat, np.zeros(len(self.lonlat), dtype=np.int64), 1)
+        segment = np.hypot(*np.diff(xy, axis=0).T)
+        segment[line[1:] != line[:-1]] = 0 #no segment between two lines
+        self._arc = np.concatenate(([0], np.cumsum(segment)))
+        self._heading = np.arctan2(*np.diff(xy, axis=0)[:, ::-1].T)
+
+        #junctions are coordinates used more than once, line ends are nodes too
+        keys = self._keys(self.lonlat)
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        is_node = counts[inverse] > 1
+        is_node[offsets[:-1]] = True
+        is_node[offsets[1:] - 1] = True
+
+        positions = np.flatnonzero(is_node)
+        same_line = line[positions[:-1]] == line[positions[1:]]
+        self.edge_start = positions[:-1][same_line]
+        self.edge_end = positions[1:][same_line]
+        self.edge_street = line[self.edge_start]
+        self.edge_length = self._arc[self.edge_end] - self._arc[self.edge_start]
+        self.n_edges = len(self.edge_start)
+
+        node_keys, node_of = np.unique(keys[positions], return_inverse=True)
+        node_at = dict(zip(positions.tolist(), node_of.tolist()))
+        self.n_nodes = len(node_keys)
+        self.edge_u = np.array([node_at[p] for p in self.edge_start.tolist()], dtype=np.int64)
+        self.edge_v = np.array([node_at[p] for p in self.edge_end.tolist()], dtype=np.int64)
+
+        self._build_adjacency()
+
+    def _keys(self, lonlat: np.ndarray) -> np.ndarray:
+        '''Packs rounded (lon, lat) into one integer, as ElevationService does'''
+        scale = 10**self.PRECISION
+        lon = np.round((lonlat[:, 0] + 180) * scale).astype(np.int64)
+        lat = np.round((lonlat[:, 1] + 90) * scale).astype(np.int64)
+        return (lon << 28) | lat
+
+    def _build_adjacency(self):
+        '''
+            Every edge as two arcs, one per direction, sorted by the node they leave.
+            Arcs of node n are arc_*[arc_offsets[n]:arc_offsets[n+1]].
+        '''
+        #loops (e.g. a close) lead nowhere new
+        edges = np.flatnonzero((self.edge_u != self.edge_v) & (self.edge_length > 0))
+        source = np.concatenate((self.edge_u[edges], self.edge_v[edges]))
+        order = np.argsort(source, kind='stable')
+
+        self.arc_edge = np.concatenate((edges, edges))[order]
+        self.arc_forward = np.concatenate((np.ones(len(edges), bool), np.zeros(len(edges), bool)))[order]
+        self.arc_target = np.where(self.arc_forward, self.edge_v[self.arc_edge], self.edge_u[self.arc_edge])
+        self.arc_offsets = np.searchsorted(source[order], np.arange(self.n_nodes + 1)).astype(np.int64)
+
+        #heading leaving the start node and arriving at the target node of every arc
+        first = self._heading[self.edge_start[self.arc_edge]]
+        last = self._heading[self.edge_end[self.arc_edge] - 1]
+        self.arc_depart = np.where(self.arc_forward, first, last + np.pi)
+        self.arc_arrive = np.where(self.arc_forward, last, first + np.pi)
+
+    def __len__(self):
+        return self.n_edges
+
+    @property
+    def degree(self) -> np.ndarray:
+        return np.diff(self.arc_offsets)
+
+    def arc_lonlat(self, arc: int) -> np.ndarray:
+        edge = self.arc_edge[arc]
+        line = self.lonlat[self.edge_start[edge]:self.edge_end[edge] + 1]
+        return line if self.arc_forward[arc] else line[::-1]
+
+    @classmethod
+    def from_street_index(cls, street_index: StreetIndex):
+        '''
+            Only the longest merged part of every street is in the index,
+            the graph misses the other parts and the junctions on them
+        '''
+        names = street_index.names
+        return cls(names, [street_index.streets[name] for name in names])
+
+    @classmethod
+    def from_elements(cls, elements: list):
+        '''
+            From Overpass way elements with geometry, every way on its own,
+            so the parts of a street StreetIndex drops when merging are kept
+        '''
+        names, lines = [], []
+        seen_ids = set()
+        for way in elements:
+            if way.get('type', 'way') != 'way' or 'geometry' not in way or way.get('id') in seen_ids:
+                continue
+            seen_ids.add(way.get('id'))
+            names.append(way.get('tags', {}).get('name', ''))
+            lines.append(way_geometry(way['geometry']))
+        return cls(names, lines)
+
+    @classmethod
+    def load_or_ingest(cls, path: Path, bbox, tiles: int = 1, overpass_json: Path = None):
+        '''
+            Network saved at path, otherwise built from the ways of the bbox,
+            read from a recorded Overpass response if given, downloaded if not
+        '''
+        path = Path(path)
+        if path.exists():
+            return cls.load(path)
+
+        if overpass_json is not None and Path(overpass_json).exists():
+            with open(overpass_json, "r") as f:
+                elements = json.load(f)['elements']
+        else:
+            elements = query_ways(bbox, tiles)
+        network = cls.from_elements(elements)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        network.save(path)
+        return network
+
+    def save(self, path: Path):
+        '''Stores the lines the network is built from, building it again is fast'''
+        with open(path, "wb") as f:
+            np.savez(f, names=np.array(self.street_names, dtype=str), offsets=self.line_offsets, coords=self.lonlat)
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path) as data:
+            names = [str(name) for name in data['names']]
+            offsets = data['offsets']
+            coords = data['coords']
+        return cls(names, [coords[offsets[i]:offsets[i+1]] for i in range(len(names))])
+
+    def stats(self) -> dict:
+        return {
+            'nodes': self.n_nodes,
+            'edges': self.n_edges,
+            'junctions': int(np.sum(self.degree > 2)),
+            'dead_ends': int(np.sum(self.degree == 1)),
+            'total_length': float(self.edge_length.sum()),
+        }
+
+
+class Route:
+    '''Path through the network, (lon, lat) points and the streets it follows'''
+
+    def __init__(self, lonlat: np.ndarray, streets: list, length: float) -> None:
+        self.lonlat = lonlat
+        self.streets = streets
+        self.length = length
+
+    @property
+    def name(self) -> str:
+        if len(self.streets) == 1:
+            return f"{self.streets[0]} {self.length:.0f}m"
+        return f"{self.streets[0]} to {self.streets[-1]} {self.length:.0f}m"
+
+    def points(self, elevation=None) -> np.ndarray:
+        '''(x, y, z) in meters around the route centre, lowest point at z=1 as in OSMRoad'''
+        xy = project_lonlat(self.lonlat, np.zeros(len(self.lonlat), dtype=np.int64), 1)
+        z = np.zeros(len(xy)) if elevation is None else elevation.elevate(self.lonlat)[:, 2]
+        return np.column_stack((xy, z - np.min(z) + 1))
+
+    def to_road(self, elevation=None, **kwargs) -> Road:
+        return Road(points=self.points(elevation), name=self.name, **kwargs)
+
+
+class RouteSampler:
+    '''
+        Random routes through a RoadNetwork, all offline.
+        A route never visits a node twice and never turns sharper than
+        max_junction_turn at a junction, the finished line is checked to be
+        simple, so bridges and tunnels crossing without a junction are rejected too.
+        Lengths are hit by cutting the last edge, so nearly every walk that
+        gets far enough becomes a valid road.
+    '''
+
+    def __init__(self, network: RoadNetwork, seed=None, max_junction_turn: float = MAX_JUNCTION_TURN) -> None:
+        self.network = network
+        self.rng = np.random.default_rng(seed)
+        self.max_junction_turn = max_junction_turn
+        #nodes a walk can start from
+        self._starts = np.flatnonzero(network.degree > 0)
+
+        self.walks = 0
+        self.dead_ends = 0 #walks stuck before reaching the length
+        self.not_simple = 0
+        self.off_curvature = 0
+
+    def _walk(self, min_length: float) -> list:
+        '''Arcs of a simple path at least min_length long, None if the walk got stuck'''
+        network = self.network
+        node = int(self.rng.choice(self._starts))
+        visited = {node}
+        arcs = []
+        length = 0.0
+        heading = None
+
+        while length < min_length:
+            begin, end = network.arc_offsets[node], network.arc_offsets[node + 1]
+            candidates = [a for a in range(begin, end) if network.arc_target[a] not in visited]
+            if heading is not None:
+                candidates = [a for a in candidates
+                              if abs(np.angle(np.exp(1j * (network.arc_depart[a] - heading)))) <= self.max_junction_turn]
+            if not candidates:
+                return None
+
+            arc = candidates[self.rng.integers(len(candidates))]
+            arcs.append(arc)
+            length += network.edge_length[network.arc_edge[arc]]
+            heading = network.arc_arrive[arc]
+            node = int(network.arc_target[arc])
+            visited.add(node)
+        return arcs
+
+    def _route(self, arcs: list, target_length: float) -> Route:
+        network = self.network
+        lonlat = np.concatenate([network.arc_lonlat(arcs[0])] + [network.arc_lonlat(a)[1:] for a in arcs[1:]])
+        streets = []
+        for arc in arcs:
+            street = network.street_names[network.edge_street[network.arc_edge[arc]]]
+            if not streets or streets[-1] != street:
+                streets.append(street)
+
+        #cut at target length
+        xy = project_lonlat(lonlat, np.zeros(len(lonlat), dtype=np.int64), 1)
+        arc_length = np.concatenate(([0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))))
+        if arc_length[-1] > target_length:
+            end = int(np.searchsorted(arc_length, target_length))
+            t = (target_length - arc_length[end - 1]) / (arc_length[end] - arc_length[end - 1])
+            last = lonlat[end - 1] + t * (lonlat[end] - lonlat[end - 1])
+            lonlat = np.vstack((lonlat[:end], last))
+        return Route(lonlat, streets, float(min(arc_length[-1], target_length)))
+
+    def sample(self, n: int, target_length: float, tolerance: float = LENGTH_TOLERANCE,
+               curvature: tuple = None) -> list:
+        '''
+            n routes close to target_length meters. curvature is (min, max) of mean
+            curvature in rad/m, routes outside of it are rejected, see road_features.py.
+            Returns fewer routes if the network does not have enough of them.
+        '''
+        if len(self._starts) == 0:
+            return []
+        min_length = target_length * (1 - tolerance)
+        routes = []
+        max_walks = self.walks + MAX_ATTEMPTS_PER_ROUTE * n
+        while len(routes) < n and self.walks < max_walks:
+            batch = []
+            while len(routes) + len(batch) < n and self.walks < max_walks:
+                self.walks += 1
+                arcs = self._walk(min_length)
+                if arcs is None:
+                    self.dead_ends += 1
+                    continue
+                route = self._route(arcs, target_length)
+                if not LineString(route.lonlat).is_simple:
+                    self.not_simple += 1
+                    continue
+                batch.append(route)
+
+            if curvature is not None and batch:
+                batch = self._filter_curvature(batch, curvature)
+            routes += batch
+        return routes
+
+    def _filter_curvature(self, routes: list, curvature: tuple) -> list:
+        '''Features of all routes in one pass'''
+        lines = [r.lonlat for r in routes]
+        offsets = np.concatenate(([0], np.cumsum([len(line) for line in lines]))).astype(np.int64)
+        road = np.repeat(np.arange(len(lines)), np.diff(offsets))
+        points = project_lonlat(np.concatenate(lines), road, len(lines))
+        mean_curvature = ragged_features(points, offsets)[:, FEATURE_NAMES.index('mean_curvature')]
+
+        low, high = curvature
+        accepted = (mean_curvature >= low) & (mean_curvature <= high)
+        self.off_curvature += int(np.sum(~accepted))
+        return [route for route, ok in zip(routes, accepted) if ok]
+
+    def stats(self) -> dict:
+        return {
+            'walks': self.walks,
+            'dead_ends': self.dead_ends,
+            'not_simple': self.not_simple,
+            'off_curvature': self.off_curvature,
+        }
+
+
+if __name__ == "__main__":
+    #python road_network.py --n 1000 --length 500
+    parser = argparse.ArgumentParser(description="Samples routes from the road network of the streets.json bbox")
+    parser.add_argument("--network", type=Path, default=Path('cache') / 'road_network.npz', help="built on first use")
+    parser.add_argument("--streets", type=Path, default=Path('streets.json'), help="file with the bbox")
+    parser.add_argument("--street-index", type=Path, help="build from a street index, misses parts of streets")
+    parser.add_argument("--n", type=int, default=1000)
+    parser.add_argument("--length", type=float, default=500, help="target route length in meters")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.street_index is not None:
+        print("Warning: street index keeps only the longest part of every street, the network is incomplete")
+        network = RoadNetwork.from_street_index(StreetIndex.load(args.street_index))
+    else:
+        with open(args.streets, "r") as f:
+            bbox = json.load(f)['bbox']
+        network = RoadNetwork.load_or_ingest(args.network, bbox)
+    print(f"Network {network.stats()} built in {time.perf_counter() - start:.2f} s")
+
+    sampler = RouteSampler(network, seed=args.seed)
+    start = time.perf_counter()
+    routes = sampler.sample(args.n, args.length)
+    seconds = time.perf_counter() - start
+    print(f"{len(routes)} routes in {seconds:.2f} s, {len(routes) / seconds:.0f} routes/s, {sampler.stats()}")
@@ -1,5 +1,4 @@
 import uuid
-import requests
 import matplotlib.pyplot as plt
 import numpy as np
 from OSMPythonTools.overpass import overpassQueryBuilder, Overpass
@@ -7,25 +6,47 @@ from pathlib import Path
 import json
 from scipy.interpolate import splprep, splev
 from geopy import distance
-from shapely import MultiLineString, LineString, line_merge, Polygon
+from shapely import LineString, Polygon
 np.set_printoptions(suppress=True)
 from abc import ABC
+from osm_cache import OSMRoadCache
+from osm_index import StreetIndex, merge_ways, way_geometry
+from elevation import ElevationService, OpenTopoDataBackend
+import profiling
+from profiling import Profile
 
 class Road:
 
     INTERPOLATED_POINTS_FOR_EACH_POINT = 2
-
-    def __init__(self, width=8, points=None, name="Test Road", max_points = None, **kwargs) -> None:
+    #adaptive resampling
+    CHORD_TOLERANCE = 0.05 #meters, max distance of the spline from a chord between nodes
+    MAX_NODE_SPACING = 10.0 #meters, also on straights, simulator meshes roads from the nodes
+    MIN_NODE_SPACING = 0.5
+    DENSE_SPACING = 0.25 #meters, spline is sampled this finely before nodes are placed
+    MAX_REFINEMENTS = 20
+
+    def __init__(self, width=8, points=None, name="Test Road", max_points = None, interpolate=True,
+                 adaptive=False, chord_tolerance=CHORD_TOLERANCE, **kwargs) -> None:
         self.width = width
         self.points = points
         self.name = name
+        #adaptive places nodes by arc length and curvature, max_points is then the node budget
+        self.adaptive = adaptive
+        self.chord_tolerance = chord_tolerance
+        self.nodes_saved = 0 #against uniform resampling
 
         if max_points is None:
             self.n_interpolated_points = self.n_points * self.INTERPOLATED_POINTS_FOR_EACH_POINT
         else:
             self.n_interpolated_points = max_points
-        self._interpolate()
-        self.right_lane_polygon = self._right_lane_polygon()
+        #OSMRoad starts it before downloading
+        self.profile = getattr(self, 'profile', None) or Profile()
+        with profiling.collect(self.profile):
+            if interpolate: #points saved from an execution are already interpolated
+                with profiling.span("interpolate"):
+                    self._interpolate()
+            with profiling.span("lane_polygon"):
+                self.right_lane_polygon = self._right_lane_polygon()
 
     @property
     def line_string(self):
@@ -47,28 +68,68 @@ class Road:
         ax.set_aspect('equal', adjustable='box')
         plt.show()
 
-    def _calculate_left_and_right_edge_point(self, p1, p2):
+    def _edge_normals(self) -> np.ndarray:
+        '''
+            For every segment of the middle lane, vector pointing
+            to the right edge, its length is half the road width
+        '''
+        direction_v = np.diff(self.points[:, 0:2], axis=0)
+        norm = np.linalg.norm(direction_v, axis=1, keepdims=True)
+        norm[norm == 0] = 1 #repeated points, avoid nans
+
+        v = (direction_v / norm) * self.width / 2
+        return np.column_stack((v[:, 1], -v[:, 0]))
+
+    def _lane_geometry(self) -> dict:
         '''
-            Given two points from middle lane, calculates
-            the point of left and right edge
+            Left and right edges of the road computed at once for all points,
+            cached until self.points is replaced
         '''
-        height = p1[2]
-        origin = np.array(p1[0:2])
-        next = np.array(p2[0:2])
+        cache = getattr(self, '_lane_cache', None)
+        if cache is not None and cache['points'] is self.points:
+            return cache
 
-        direction_v = np.subtract(next, origin)
+        normals = self._edge_normals()
+        origins = self.points[:-1]
 
-        # calculate the vector which length is half the road width
-        v = (direction_v / np.linalg.norm(direction_v)) * self.width / 2
-        # add normal vectors
-        left_point = origin + np.array([-v[1], v[0]])
-        right_point = origin + np.array([v[1], -v[0]])
+        left = np.column_stack((origins[:, 0:2] - normals, origins[:, 2]))
+        right = np.column_stack((origins[:, 0:2] + normals, origins[:, 2]))
 
-        #add origin height
-        left_point = np.append(left_point, height)
-        right_point = np.append(right_point, height)
+        #add last point, as linear interpolation
+        if len(right) > 1:
+            left = np.vstack((left, 2*left[-1] - left[-2]))
+            right = np.vstack((right, 2*right[-1] - right[-2]))
+        else:
+            last = self.points[-1]
+            left = np.vstack((left, np.append(last[0:2] - normals[-1], last[2])))
+            right = np.vstack((right, np.append(last[0:2] + normals[-1], last[2])))
+
+        self._lane_cache = {
+            'points': self.points,
+            'normals': normals,
+            'left_edge': left,
+            'right_edge': right,
+            #middle lane backwards, then right edge forwards
+            'lane_polygon': np.vstack((self.points[::-1], right)),
+        }
+        return self._lane_cache
 
-        return left_point, right_point
+    @property
+    def edge_normals(self) -> np.ndarray:
+        return self._lane_geometry()['normals']
+
+    @property
+    def left_edge(self) -> np.ndarray:
+        return self._lane_geometry()['left_edge']
+
+    @property
+    def right_edge(self) -> np.ndarray:
+        return self._lane_geometry()['right_edge']
+
+    @property
+    def lane_polygon(self) -> np.ndarray:
+        '''Points of the right lane polygon'''
+        return self._lane_geometry()['lane_polygon']
 
     def _interpolate(self):
     
@@ -76,36 +137,105 @@ class Road:
         pos_tck, _ = splprep(self.points.T, s=1, k=SPLINE_DEGREE)        
         unew = np.linspace(0, 1, self.n_interpolated_points)
 
+        if self.adaptive:
+            self.points = self._adaptive_resample(pos_tck)
+            #uniform resampling would place n_interpolated_points, also when max_points is given
+            self.nodes_saved = self.n_interpolated_points - self.n_points
+            profiling.count("nodes_saved", self.nodes_saved)
+            return
+
         interpolated = splev(unew, pos_tck) #retured as list of ND arrays
         self.points = np.array(interpolated).T
 
+    def _adaptive_resample(self, pos_tck) -> np.ndarray:
+        '''
+            Nodes spaced by arc length and curvature so that the chord between two nodes
+            stays within chord_tolerance of the spline, with at most n_interpolated_points nodes.
+            For an arc of curvature k a chord of length L deviates L^2 * k / 8, so nodes are first
+            placed sqrt(8 * tolerance / k) apart, capped by MAX_NODE_SPACING. Sharp corners
+            of the spline are missed by that, so nodes are then added at the worst point
+            of every chord still over the tolerance.
+        '''
+        coarse = np.array(splev(np.linspace(0, 1, self.n_points), pos_tck)).T
+        length = np.linalg.norm(np.diff(coarse, axis=0), axis=1).sum()
+        n_dense = max(self.n_points, int(np.ceil(length / self.DENSE_SPACING)) + 1)
+        dense = np.array(splev(np.linspace(0, 1, n_dense), pos_tck)).T
+
+        segments = np.diff(dense, axis=0)
+        segment_lengths = np.linalg.norm(segments, axis=1)
+        arc_length = np.concatenate(([0], np.cumsum(segment_lengths)))
+
+        #turning angle between 3D segments, covers bends and changes of grade
+        tangents = segments / np.maximum(segment_lengths, 1e-9)[:, None]
+        cos_turn = np.clip(np.einsum('ij,ij->i', tangents[:-1], tangents[1:]), -1, 1)
+        curvature = np.arccos(cos_turn) / np.maximum((segment_lengths[:-1] + segment_lengths[1:]) / 2, 1e-9)
+        curvature = np.concatenate(([0], curvature, [0]))
+
+        spacing = np.sqrt(8 * self.chord_tolerance / np.maximum(curvature, 1e-12))
+        spacing = np.clip(spacing, self.MIN_NODE_SPACING, self.MAX_NODE_SPACING)
+
+        #cumulative number of nodes needed along the road
+        density = 1 / spacing
+        needed = np.concatenate(([0], np.cumsum((density[:-1] + density[1:]) / 2 * segment_lengths)))
+        budget = max(2, self.n_interpolated_points)
+        n_nodes = int(np.clip(np.ceil(needed[-1]) + 1, 2, budget))
+        #nodes are kept on dense samples, so refining can hit spline corners exactly
+        nodes = np.unique(np.searchsorted(arc_length, np.interp(
+            np.linspace(0, needed[-1], n_nodes), needed, arc_length)).clip(0, n_dense - 1))
+        nodes[0], nodes[-1] = 0, n_dense - 1
+
+        for _ in range(self.MAX_REFINEMENTS):
+            if len(nodes) >= budget:
+                break
+            interval, deviation = self._chord_deviation(dense, nodes)
+
+            #worst dense point of every interval
+            order = np.lexsort((deviation, interval))
+            last = np.flatnonzero(np.diff(interval[order], append=-1))
+            worst = order[last]
+            worst = worst[deviation[worst] > self.chord_tolerance]
+            if len(worst) == 0:
+                break
+            worst = worst[np.argsort(-deviation[worst])][:budget - len(nodes)]
+            nodes = np.union1d(nodes, worst)
+
+        return dense[nodes]
+
+    @staticmethod
+    def _chord_deviation(dense: np.ndarray, nodes: np.ndarray):
+        '''For every dense point, index of the chord between nodes it belongs to and distance to it'''
+        interval = np.clip(np.searchsorted(nodes, np.arange(len(dense)), side='right') - 1, 0, len(nodes) - 2)
+        a = dense[nodes[interval]]
+        ab = dense[nodes[interval + 1]] - a
+        t = np.einsum('ij,ij->i', dense - a, ab) / np.maximum(np.einsum('ij,ij->i', ab, ab), 1e-12)
+        closest = a + np.clip(t, 0, 1)[:, None] * ab
+        return interval, np.linalg.norm(dense - closest, axis=1)
 
     def _right_lane_polygon(self) -> Polygon:
+        return Polygon(self.lane_polygon)
 
-        polygon_points = np.copy(self.points[::-1])
-        #iterate pair wise
-        for previous, current in zip(self.points, self.points[1:]):
-            _, right = self._calculate_left_and_right_edge_point(previous, current)
-            right = right.reshape((1,3))
-            polygon_points = np.append(polygon_points, right, axis=0)
 
-        #add last point, as linear interpolation
-        diff = polygon_points[-1] - polygon_points[-2]
-        last_point = polygon_points[-1] + diff
-        last_point = last_point.reshape((1,3))
-        polygon_points = np.append(polygon_points, last_point, axis=0)
-        p = Polygon(polygon_points)
-        return p
+class OSMRoad(Road):
 
+    ELEVATION_DATASET = "eudem25m"
 
-class OSMRoad(Road):
-    def __init__(self, bbox, street_name, **kwargs) -> None:
+    def __init__(self, bbox, street_name, cache: OSMRoadCache = None,
+                 street_index: StreetIndex = None, elevation: ElevationService = None, **kwargs) -> None:
         
         self.bbox = bbox
         self.street_name = street_name #for OSM query
-
-        self._download_street_points()
-        self._add_elevation()
+        self.street_index = street_index #if set, used instead of OSM query
+        if elevation is None:
+            elevation = ElevationService(OpenTopoDataBackend(self.ELEVATION_DATASET))
+        self.elevation = elevation
+
+        self.profile = Profile() #phases of preparing this road
+        with profiling.collect(self.profile):
+            if cache is None:
+                self._fetch_points()
+            else:
+                self.points = cache.get_or_fetch(
+                    bbox, street_name, self.elevation.dataset, self._fetch_points)
         self._project_points()
         self._shift_height()
 
@@ -114,6 +244,12 @@ class OSMRoad(Road):
 
         super().__init__(points=self.osm_points, name=street_name, **kwargs)
 
+    def _fetch_points(self) -> np.ndarray:
+        '''Downloads street geometry with elevation, returns (lon, lat, elevation) points'''
+        self._download_street_points()
+        self._add_elevation()
+        return self.points
+
     def _shift_height(self):
         '''Shift down Z (up) axis'''
         min_z = np.min(self.points[:, 2])
@@ -142,43 +278,23 @@ class OSMRoad(Road):
             includeGeometry=True, 
             selector=f'"name"="{self.street_name}"')
 
-        elements = Overpass().query(query).toJSON()['elements']
+        with profiling.span("osm_query"):
+            elements = Overpass().query(query).toJSON()['elements']
         return elements
 
-    def _get_geometry(self, geom):
-        points = [(point['lon'], point['lat']) for point in geom]
-        points = np.array(points)
-        return points
-
     def _download_street_points(self):
 
+        if self.street_index is not None:
+            self.points = self.street_index.get(self.street_name)
+            return
+
         ways = self._query()
-        way_geometries = []
-        for way in ways:
-            g = self._get_geometry(way['geometry'])
-            way_geometries.append(g)
-
-        mls = MultiLineString(way_geometries)
-        mls = line_merge(mls)
-
-        if isinstance(mls, MultiLineString):
-            #pick the longest one
-            lengths = [g.length for g in mls.geoms]
-            longest = np.argmax(lengths)
-            mls = mls.geoms[longest]
-        
-        if not isinstance(mls, (LineString, MultiLineString)):
-            input("Debug")
-            
-        self.points = np.array(mls.coords)
-
-    def _add_elevation(self, dataset="eudem25m"):
-        points_str = [f"{lat},{lon}" for lon, lat in self.points]
-        locations = "|".join(points_str)
-        response = requests.get(
-            f"https://api.opentopodata.org/v1/{dataset}?locations={locations}")
-        elevations = [p['elevation'] for p in response.json()['results']]
-        self.points = np.column_stack((self.points, elevations))
+        way_geometries = [way_geometry(way['geometry']) for way in ways]
+        self.points = merge_ways(way_geometries)
+
+    def _add_elevation(self):
+        with profiling.span("elevation"):
+            self.points = self.elevation.elevate(self.points)
 
 
 
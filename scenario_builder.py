@@ -0,0 +1,102 @@
+import hashlib
+import os
+from pathlib import Path
+from beamngpy import Scenario, Vehicle
+from beamng_test_case import BeamNGTestCase
+import profiling
+
+
+class ScenarioBuilder:
+    '''
+        Prepares BeamNG for a test case, reusing as much of the previous test as possible.
+        The scenario files are made once per simulator, the vehicle is then teleported
+        to the start pose of each road. The level file is written only when its
+        content hash changed, and the level is reloaded only when the road changed,
+        otherwise the loaded scenario is restarted.
+    '''
+
+    LEVEL = 'smallgrid'
+    SCENARIO_NAME = 'osm_testing'
+
+    def __init__(self) -> None:
+        self.bng = None
+        self.scenario = None
+        self.vehicle = None
+        self.loaded_level = None #hash of the level file the simulator has loaded
+        self.written = {} #level file path -> hash of its content
+
+        self.level_writes = 0
+        self.level_skips = 0
+        self.scenario_loads = 0
+        self.scenario_restarts = 0
+
+    def _bind(self, bng):
+        '''A relaunched simulator has nothing loaded, the scenario is made again for it'''
+        if bng is self.bng:
+            return
+        self.bng = bng
+        self.scenario = None
+        self.vehicle = None
+        self.loaded_level = None
+
+    def write_level(self, test_case: BeamNGTestCase) -> str:
+        '''Writes the road objects to the level file unless it already has them, returns content hash'''
+        content = test_case.level_file_content
+        digest = hashlib.sha1(content).hexdigest()
+        path = Path(test_case.file_path)
+
+        if self.written.get(path) != digest and path.exists():
+            #e.g. left there by a previous campaign
+            with open(path, "rb") as f:
+                if hashlib.sha1(f.read()).hexdigest() == digest:
+                    self.written[path] = digest
+
+        if self.written.get(path) == digest and path.exists():
+            self.level_skips += 1
+            profiling.count("level_writes_skipped")
+            return digest
+
+        with profiling.span("write_road"):
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        self.written[path] = digest
+        self.level_writes += 1
+        return digest
+
+    def load(self, bng, test_case: BeamNGTestCase, level_digest: str):
+        '''Scenario with the vehicle at the start of the road, not started yet'''
+        self._bind(bng)
+        pos, rot = test_case.vehicle_start_pose()
+
+        if self.scenario is None:
+            self.scenario = Scenario(self.LEVEL, self.SCENARIO_NAME)
+            self.vehicle = Vehicle('car', model='etk800', licence='OSM Testing', color='Blue')
+            self.scenario.add_vehicle(self.vehicle, pos=pos, rot=rot)
+            # Place files defining our scenario for the simulator to read, once
+            self.scenario.make(self.bng)
+
+        if self.loaded_level == level_digest:
+            #same road, resetting the scenario is enough
+            self.bng.restart_scenario()
+            self.scenario_restarts += 1
+        else:
+            self.bng.load_scenario(self.scenario)
+            self.loaded_level = level_digest
+            self.scenario_loads += 1
+
+        self.bng.teleport_vehicle(self.vehicle.vid, pos, rot=rot)
+        return self.scenario, self.vehicle
+
+    def stats(self) -> dict:
+        return {
+            'level_writes': self.level_writes,
+            'level_skips': self.level_skips,
+            'scenario_loads': self.scenario_loads,
+            'scenario_restarts': self.scenario_restarts,
+        }
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
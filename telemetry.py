@@ -0,0 +1,171 @@
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+import numpy as np
+from trajectory import TRAJECTORY_COLUMNS, ARRAY_FIELDS, write_execution_data
+
+MAGIC = b"BNGTLM1\n"
+
+#one record per tick, fixed size so a partial run is read up to its last whole record
+RECORD_DTYPE = np.dtype([
+    ('tick', np.int32),
+    ('time', np.float32),
+    ('out_of_bounds', np.float32), #nan when recorded only
+    ('bbox', np.float32, (4, 3)),
+    ('position', np.float32, (3,)), #nan when vehicle state was not available
+    ('velocity', np.float32, (3,)),
+])
+
+
+class TelemetryWriter:
+    '''
+        Append-only record log of a running execution.
+        append() only copies the tick into a preallocated chunk, every flush_every
+        records the chunk is handed to a background thread which writes it
+        (and prints it, if console is on), so the tick loop never blocks on I/O
+        or formats strings. If the process dies, everything up to the last flush survives.
+    '''
+
+    def __init__(self, path: Path, header: dict, flush_every=20, console=False, fsync=False) -> None:
+        self.path = None if path is None else Path(path)
+        self.flush_every = max(1, flush_every)
+        self.console = console
+        self.fsync = fsync
+        self.records = 0
+
+        self._chunk = np.zeros(self.flush_every, dtype=RECORD_DTYPE)
+        self._n = 0
+        self._queue = queue.Queue()
+
+        self._file = None
+        if self.path is not None:
+            self._file = open(self.path, "wb")
+            self._write_header(header)
+
+        #nothing to write or print, records are only counted
+        self._thread = None
+        if self._file is not None or self.console:
+            self._thread = threading.Thread(target=self._consume, daemon=True)
+            self._thread.start()
+
+    def _write_header(self, header: dict):
+        encoded = json.dumps(header).encode("utf-8")
+        self._file.write(MAGIC)
+        self._file.write(len(encoded).to_bytes(4, "little"))
+        self._file.write(encoded)
+        self._file.flush()
+
+    def append(self, tick: int, time: float, oob, footprint, position, velocity):
+        record = self._chunk[self._n]
+        record['tick'] = tick
+        record['time'] = time
+        record['out_of_bounds'] = np.nan if oob is None else oob
+        record['bbox'] = footprint
+        record['position'] = np.nan if position is None else position
+        record['velocity'] = np.nan if velocity is None else velocity
+        self._n += 1
+        self.records += 1
+
+        if self._n == self.flush_every:
+            self.flush()
+
+    def flush(self):
+        '''Hands the buffered records to the writer thread'''
+        if self._n == 0:
+            return
+        if self._thread is not None:
+            self._queue.put(self._chunk[:self._n])
+        self._chunk = np.zeros(self.flush_every, dtype=RECORD_DTYPE)
+        self._n = 0
+
+    def _consume(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+
+            if self._file is not None:
+                self._file.write(chunk.tobytes())
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+
+            if self.console:
+                for r in chunk:
+                    print(f"{r['time']:7.2f}s Oob: {r['out_of_bounds']:.2f}, "
+                          f"Position: {np.around(r['position'], 2)}, Velocity: {np.linalg.norm(r['velocity']):.2f} m/s")
+
+    def close(self):
+        '''Writes the rest and waits for the writer thread'''
+        self.flush()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_telemetry(path: Path):
+    '''Returns (header, records), a truncated last record of a crashed run is ignored'''
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a telemetry log")
+        header_size = int.from_bytes(f.read(4), "little")
+        header = json.loads(f.read(header_size).decode("utf-8"))
+        body = f.read()
+
+    n = len(body) // RECORD_DTYPE.itemsize
+    records = np.frombuffer(body, dtype=RECORD_DTYPE, count=n)
+    return header, records
+
+
+def recover_execution_data(path: Path) -> dict:
+    '''Execution data of a partial run, finish tells it did not end'''
+    header, records = read_telemetry(path)
+    execution_data = dict(header)
+    execution_data['finish'] = f"Interrupted after {len(records)} ticks"
+    execution_data['success'] = False
+
+    execution_data['bbox'] = records['bbox']
+    oob = records['out_of_bounds']
+    if len(oob) and not np.isnan(oob).all():
+        execution_data['out_of_bounds'] = oob
+    has_state = ~np.isnan(records['position']).any(axis=1)
+    execution_data['position'] = records['position'][has_state]
+    execution_data['velocity'] = records['velocity'][has_state]
+    return execution_data
+
+
+def telemetry_header(execution_data: dict) -> dict:
+    '''Static part of execution data, what a recovered run needs besides the records'''
+    header = {}
+    for key, value in execution_data.items():
+        if key in TRAJECTORY_COLUMNS:
+            continue
+        header[key] = np.asarray(value).tolist() if key in ARRAY_FIELDS else value
+    return header
+
+
+def recover_results_dir(results_dir: Path) -> dict:
+    '''Turns telemetry logs left behind by crashed runs into regular results'''
+    counts = {'recovered': 0, 'failed': 0}
+    for path in sorted(Path(results_dir).glob("*.telemetry")):
+        try:
+            execution_data = recover_execution_data(path)
+        except (ValueError, OSError) as e:
+            print(f"Cannot recover {path}: {e!r}")
+            counts['failed'] += 1
+            continue
+
+        write_execution_data(path.with_suffix(".json"), execution_data)
+        os.remove(path)
+        counts['recovered'] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")
@@ -0,0 +1,135 @@
+import pytest
+import beamng_session
+from beamng_session import BeamNGSession
+
+LAUNCH_SECONDS = 30.0
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+class FakeProcess:
+    def __init__(self) -> None:
+        self.exit_code = None
+
+    def poll(self):
+        return self.exit_code
+
+
+class FakeBeamNG:
+    '''Local stand-in for the BeamNGpy endpoint, launching takes LAUNCH_SECONDS on the clock'''
+
+    def __init__(self, clock: Clock, instances: list, host, port, home=None, user=None) -> None:
+        self.clock = clock
+        self.port = port
+        self.process = FakeProcess()
+        self.responding = True
+        self.opened = False
+        self.closed = False
+        instances.append(self)
+
+    def open(self, launch=True):
+        self.clock.now += LAUNCH_SECONDS
+        self.opened = True
+
+    def get_gamestate(self):
+        if not self.responding:
+            raise ConnectionResetError("no reply")
+        return {'state': 'menu'}
+
+    def close(self):
+        self.closed = True
+        if self.process.exit_code is not None:
+            raise ConnectionResetError("process is gone")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(beamng_session, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def instances():
+    return []
+
+
+@pytest.fixture
+def session(clock, instances, tmp_path):
+    factory = lambda *args, **kwargs: FakeBeamNG(clock, instances, *args, **kwargs)
+    return BeamNGSession(tmp_path / "home", tmp_path / "user", port=64300, bng_factory=factory)
+
+
+def test_nothing_launched_before_first_use(session, instances):
+    assert not session.is_open
+    assert not session.is_alive()
+    assert instances == []
+
+
+def test_launches_once(session, instances):
+    assert session.ensure_open() == LAUNCH_SECONDS
+    assert session.ensure_open() == 0.0
+
+    assert len(instances) == 1
+    assert instances[0].opened
+    assert instances[0].port == 64300
+
+
+def test_reused_across_tests(session, instances):
+    for reload_time in (2.0, 4.0, 3.0):
+        session.ensure_open()
+        session.record_reload(reload_time)
+
+    stats = session.stats()
+    assert len(instances) == 1
+    assert stats['launches'] == 1
+    assert stats['launch_time'] == LAUNCH_SECONDS
+    assert stats['reloads'] == 3
+    assert stats['mean_reload_time'] == pytest.approx(3.0)
+
+
+def test_dead_process_is_relaunched(session, instances):
+    session.ensure_open()
+    instances[0].process.exit_code = 1
+    assert not session.is_alive()
+
+    #closing the dead simulator fails, the session still moves on
+    assert session.ensure_open() == LAUNCH_SECONDS
+    assert len(instances) == 2
+    assert instances[0].closed
+    assert session.bng is instances[1]
+    assert session.stats()['launches'] == 2
+    assert session.stats()['launch_time'] == 2 * LAUNCH_SECONDS
+
+
+def test_unresponsive_simulator_is_relaunched(session, instances):
+    session.ensure_open()
+    instances[0].responding = False
+
+    session.ensure_open()
+    assert len(instances) == 2
+    assert session.is_alive()
+
+
+def test_relaunch_resets_scenario_builder(session, instances):
+    session.ensure_open()
+    session.scenario_builder._bind(session.bng)
+    session.scenario_builder.loaded_level = "digest"
+
+    instances[0].process.exit_code = 1
+    session.ensure_open()
+    session.scenario_builder._bind(session.bng)
+    assert session.scenario_builder.loaded_level is None
+
+
+def test_context_manager_closes(session, instances):
+    with session:
+        session.ensure_open()
+    assert instances[0].closed
+    assert not session.is_open
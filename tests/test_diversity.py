@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from beamng_test_case import TestCase
+from diversity import DiversitySelector
+from road_features import RoadFeatures, FEATURE_NAMES
+
+
+@pytest.fixture
+def catalog():
+    '''Roads with log-normal lengths, a good share too short or too long to run'''
+    rng = np.random.default_rng(0)
+    n = 3000
+    features = rng.uniform(0, 1, size=(n, len(FEATURE_NAMES)))
+    features[:, FEATURE_NAMES.index('length')] = rng.lognormal(np.log(400), 1.0, size=n)
+    return RoadFeatures([f"Road {i}" for i in range(n)], features)
+
+
+def length_of(catalog, names):
+    return catalog.rows(names)[:, FEATURE_NAMES.index('length')]
+
+
+def test_picks_only_valid_roads(catalog):
+    selector = DiversitySelector(catalog)
+    picked = selector.select(20)
+
+    assert len(picked) == 20
+    length = length_of(catalog, picked)
+    assert np.all(length >= TestCase.MIN_ROAD_LENGTH)
+    assert np.all(length <= TestCase.MAX_ROAD_LENGTH)
+
+
+def test_coverage_over_valid_roads(catalog):
+    selector = DiversitySelector(catalog)
+    selector.select(5)
+    coverage = selector.coverage()
+
+    length = catalog.column('length')
+    n_valid = int(np.sum((length >= TestCase.MIN_ROAD_LENGTH) & (length <= TestCase.MAX_ROAD_LENGTH)))
+    assert coverage['candidates'] == n_valid
+    assert coverage['invalid'] == len(catalog) - n_valid
+    assert coverage['invalid'] > 0
+
+
+def test_invalid_executed_roads_are_ignored(catalog):
+    length = catalog.column('length')
+    too_short = catalog.names[int(np.argmin(length))]
+    selector = DiversitySelector(catalog)
+    selector.mark_executed([too_short])
+    assert selector.executed == []
+
+
+def test_no_valid_candidates(catalog):
+    selector = DiversitySelector(catalog, length_range=(0, 1))
+    assert selector.select(5) == []
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from elevation import DEMBackend, ElevationService
+
+#4x4 pixels of 0.001 degree, elevation rising 10 m per pixel to the east
+ORIGIN_LON, ORIGIN_LAT, PIXEL = -1.47, 53.384, 0.001
+
+
+@pytest.fixture
+def dem():
+    raster = np.tile(np.arange(4) * 10.0, (4, 1))
+    return DEMBackend(raster, (ORIGIN_LON, PIXEL, ORIGIN_LAT, -PIXEL))
+
+
+def centre(col: float, row: float) -> list:
+    return [ORIGIN_LON + (col + 0.5) * PIXEL, ORIGIN_LAT - (row + 0.5) * PIXEL]
+
+
+def test_bilinear_inside(dem):
+    z = dem.lookup(np.array([centre(0, 0), centre(1.5, 2), centre(3, 3)]))
+    np.testing.assert_allclose(z, [0, 15, 30])
+
+
+def test_no_data_outside(dem):
+    z = dem.lookup(np.array([centre(-1, 1), centre(1, 4), centre(5, 5), centre(2, 1)]))
+    assert np.isnan(z[0:3]).all()
+    assert z[3] == pytest.approx(20)
+
+
+def test_outside_points_are_interpolated(dem):
+    line = np.array([centre(1, 1), centre(2, 1), centre(3, 1), centre(4, 1)])
+    points = ElevationService(dem).elevate(line)
+    #the last point is off the raster, it takes the nearest elevation along the line
+    np.testing.assert_allclose(points[:, 2], [10, 20, 30, 30])
+
+
+def test_line_off_the_raster(dem):
+    with pytest.raises(ValueError):
+        ElevationService(dem).elevate(np.array([centre(10, 10), centre(11, 10)]))
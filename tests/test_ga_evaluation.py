@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+import pytest
+from ga_evaluation import GAEvaluation
+from multi_fidelity import INVALID_FITNESS
+
+
+def build_test(ga_instance, solution, solution_idx):
+    '''Genomes starting with a negative gene stand for invalid roads'''
+    if solution[0] < 0:
+        return None
+    return SimpleNamespace(solution=list(solution), execution_data={'fitness': float(sum(solution))})
+
+
+@pytest.fixture
+def evaluation(tmp_path):
+    evaluation = GAEvaluation(build_test, lambda execution_data: execution_data['fitness'],
+                              results_dir=tmp_path / "results",
+                              fitness_cache_path=tmp_path / "fitness.sqlite",
+                              settings={'score_version': 1},
+                              simulator="kinematic")
+    evaluation.simulated = []
+
+    def simulate(test):
+        evaluation.simulated.append(test.solution)
+        return evaluation.score(test.execution_data)
+
+    evaluation.simulate = simulate
+    yield evaluation
+    evaluation.close()
+
+
+def test_nothing_opened_before_first_generation(evaluation, tmp_path):
+    assert evaluation.pool is None
+    assert not (tmp_path / "fitness.sqlite").exists()
+    assert evaluation.settings['simulator'] == "kinematic"
+
+
+def test_invalid_roads_are_not_simulated(evaluation):
+    fitness = evaluation.evaluate(None, [[1, 2], [-1, 2], [3, 4]], [0, 1, 2])
+
+    assert fitness == [3.0, INVALID_FITNESS, 7.0]
+    assert evaluation.simulated == [[1, 2], [3, 4]]
+
+
+def test_cached_genomes_are_not_simulated_again(evaluation):
+    evaluation.evaluate(None, [[1, 2], [-1, 2]], [0, 1])
+    evaluation.simulated.clear()
+
+    assert evaluation.evaluate(None, [[1, 2], [-1, 2], [5, 5]], [0, 1, 2]) == [3.0, INVALID_FITNESS, 10.0]
+    assert evaluation.simulated == [[5, 5]]
+    assert evaluation.stats()['fitness_cache']['hits'] == 2
+
+
+def test_duplicates_in_a_batch_are_simulated_once(evaluation):
+    #genomes equal after rounding to FitnessCache.QUANTUM are the same road
+    solutions = [[1, 2], [3, 4], [1, 2], [1.001, 2], [-1, 2], [-1, 2]]
+    fitness = evaluation.evaluate(None, solutions, list(range(len(solutions))))
+
+    assert fitness == [3.0, 7.0, 3.0, 3.0, INVALID_FITNESS, INVALID_FITNESS]
+    assert evaluation.simulated == [[1, 2], [3, 4]]
+    assert evaluation.fitness_cache.generation_stats() == {'hits': 3, 'misses': 3, 'hit_rate': 0.5}
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+import numpy as np
+from multi_fidelity import INVALID_FITNESS, MultiFidelityEvaluator
+
+
+def straight_test(length: float):
+    points = np.column_stack((np.linspace(0, length, 20), np.zeros(20), np.ones(20)))
+    return SimpleNamespace(road=SimpleNamespace(points=points))
+
+
+class FixedSurrogate:
+    '''Calibrated surrogate predicting the given values in order'''
+
+    calibrated = True
+
+    def __init__(self, predicted: list) -> None:
+        self.predicted = np.array(predicted, dtype=np.float64)
+        self.fitness = []
+
+    def predict(self, features):
+        return self.predicted
+
+    def add(self, features, fitness):
+        self.fitness.append(fitness)
+
+    def fit(self):
+        pass
+
+
+def evaluator(simulated: list, predicted: list) -> MultiFidelityEvaluator:
+    evaluator = MultiFidelityEvaluator(lambda tests: simulated[:len(tests)], promote_fraction=0.5)
+    evaluator.surrogate = FixedSurrogate(predicted)
+    return evaluator
+
+
+def test_screened_below_simulated():
+    #the two highest predictions are simulated
+    fitness = evaluator([5.0, 3.0], [10.0, 9.0, 8.0, 1.0]).evaluate([straight_test(200)] * 4)
+
+    assert fitness[0:2] == [5.0, 3.0]
+    assert fitness[2] < 3.0
+    assert fitness[3] == 1.0
+
+
+def test_failed_run_does_not_drag_screened_below_invalid():
+    fitness = evaluator([INVALID_FITNESS, 3.0], [10.0, 9.0, 8.0, 1.0]).evaluate([straight_test(200)] * 4)
+
+    assert fitness[2] < 3.0
+    assert all(f > INVALID_FITNESS for f in fitness[2:])
+
+
+def test_all_runs_failed():
+    fitness = evaluator([INVALID_FITNESS, INVALID_FITNESS], [10.0, 9.0, 8.0, -5.0]).evaluate([straight_test(200)] * 4)
+
+    assert fitness[2] == 8.0
+    assert INVALID_FITNESS < fitness[3] < 0
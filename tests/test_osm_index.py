@@ -0,0 +1,88 @@
+from pathlib import Path
+import numpy as np
+import pytest
+import roads
+from elevation import ElevationService
+from osm_index import StreetIndex, merge_ways
+from roads import OSMRoad
+
+FIXTURE = Path(__file__).parent / "fixtures" / "overpass_streets.json"
+
+
+class SlopeBackend:
+    '''Elevation rising 1 m per 0.001 degree of longitude, no network'''
+
+    dataset = "slope"
+
+    def lookup(self, lonlat: np.ndarray) -> np.ndarray:
+        return (lonlat[:, 0] + 1.47) * 1000
+
+
+@pytest.fixture
+def index():
+    return StreetIndex.from_overpass_json(FIXTURE)
+
+
+def test_named_ways_are_indexed(index):
+    assert index.names == ['Alpha Road', 'Beta Street', 'Gamma Lane']
+    assert 'Dot Close' not in index
+    assert len(index) == 3
+
+
+def test_ways_of_a_street_are_merged_once(index):
+    #way 101 comes twice (tile overlap), a duplicate would break the merge into a line
+    alpha = index.get('Alpha Road')
+    assert alpha.shape == (5, 2)
+    np.testing.assert_allclose(alpha[0], [-1.470, 53.380])
+    np.testing.assert_allclose(alpha[-1], [-1.466, 53.3804])
+
+
+def test_disconnected_street_keeps_longest_part(index):
+    gamma = index.get('Gamma Lane')
+    assert len(gamma) == 4
+    np.testing.assert_allclose(gamma[:, 0], -1.466)
+
+
+def test_get_returns_copy(index):
+    index.get('Beta Street')[:] = 0
+    assert index.get('Beta Street')[0, 0] != 0
+
+
+def test_unknown_street(index):
+    with pytest.raises(KeyError):
+        index.get('Nowhere Road')
+
+
+def test_save_load_round_trip(index, tmp_path):
+    path = tmp_path / "street_index.npz"
+    index.save(path)
+    loaded = StreetIndex.load(path)
+
+    assert loaded.names == index.names
+    for name in index.names:
+        np.testing.assert_array_equal(loaded.get(name), index.get(name))
+
+
+def test_load_or_ingest_uses_saved_index(index, tmp_path, monkeypatch):
+    path = tmp_path / "street_index.npz"
+    index.save(path)
+    monkeypatch.setattr(StreetIndex, "ingest", classmethod(lambda *args, **kwargs: pytest.fail("queried Overpass")))
+    assert StreetIndex.load_or_ingest(path, bbox=[0, 0, 1, 1]).names == index.names
+
+
+def test_merge_ways_without_line():
+    with pytest.raises(ValueError):
+        merge_ways([])
+
+
+def test_osm_road_from_index_is_offline(index, monkeypatch):
+    monkeypatch.setattr(roads, "Overpass", lambda *args, **kwargs: pytest.fail("queried Overpass"))
+    road = OSMRoad(bbox=[53.37, -1.48, 53.39, -1.46], street_name='Alpha Road',
+                   street_index=index, elevation=ElevationService(SlopeBackend()))
+
+    assert road.name == 'Alpha Road'
+    #about 270 m along the street, interpolation changes it only a little
+    assert road.line_string.length == pytest.approx(269, rel=0.02)
+    #lowest point shifted to z=1, the street climbs 4 m
+    assert np.min(road.osm_points[:, 2]) == pytest.approx(1)
+    assert np.max(road.osm_points[:, 2]) == pytest.approx(5)
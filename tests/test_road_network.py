@@ -0,0 +1,135 @@
+import json
+from pathlib import Path
+import numpy as np
+import pytest
+from shapely import LineString
+from osm_index import StreetIndex
+from road_features import road_features, FEATURE_NAMES
+from road_network import RoadNetwork, RouteSampler
+
+FIXTURE = Path(__file__).parent / "fixtures" / "overpass_streets.json"
+GRID = 5 #streets each way
+LON_STEP = 0.0015 #~100 m at Sheffield latitude
+LAT_STEP = 0.001 #~111 m
+LON0, LAT0 = -1.47, 53.38
+
+
+def grid_lines() -> tuple:
+    '''GRID x GRID straight streets crossing at shared points, with a point between every two junctions'''
+    t = np.arange(2 * (GRID - 1) + 1) / 2
+    names, lines = [], []
+    for i in range(GRID):
+        names.append(f"East {i}")
+        lines.append(np.column_stack((LON0 + t * LON_STEP, np.full(len(t), LAT0 + i * LAT_STEP))))
+        names.append(f"North {i}")
+        lines.append(np.column_stack((np.full(len(t), LON0 + i * LON_STEP), LAT0 + t * LAT_STEP)))
+    return names, lines
+
+
+@pytest.fixture
+def grid():
+    return RoadNetwork(*grid_lines())
+
+
+@pytest.fixture
+def elements():
+    with open(FIXTURE, "r") as f:
+        return json.load(f)['elements']
+
+
+def test_grid_graph(grid):
+    stats = grid.stats()
+    assert stats['nodes'] == GRID * GRID
+    assert stats['edges'] == 2 * GRID * (GRID - 1)
+    assert stats['dead_ends'] == 0
+    #corners have two roads, the rest are junctions
+    assert stats['junctions'] == GRID * GRID - 4
+    assert np.all(grid.edge_u != grid.edge_v)
+
+
+def test_arcs_end_where_next_arcs_start(grid):
+    for arc in range(len(grid.arc_edge)):
+        line = grid.arc_lonlat(arc)
+        assert len(line) == 3 #junction, point between, junction
+        target = grid.arc_target[arc]
+        following = grid.arc_lonlat(grid.arc_offsets[target])
+        assert grid._keys(line[-1:])[0] == grid._keys(following[:1])[0]
+
+
+def test_from_elements_keeps_every_way(elements):
+    network = RoadNetwork.from_elements(elements)
+    #Alpha Road (2 ways), Beta Street split at the junction, both parts of Gamma Lane, unnamed footway
+    assert network.stats()['nodes'] == 9
+    assert network.stats()['edges'] == 7
+
+
+def test_street_index_misses_parts_of_streets(elements):
+    network = RoadNetwork.from_street_index(StreetIndex.from_elements(elements))
+    assert network.stats()['nodes'] == 6
+    assert network.stats()['edges'] == 5
+
+
+def test_save_load_round_trip(grid, tmp_path):
+    path = tmp_path / "road_network.npz"
+    grid.save(path)
+    loaded = RoadNetwork.load(path)
+    assert loaded.stats() == grid.stats()
+    assert loaded.street_names == grid.street_names
+
+
+def test_load_or_ingest_from_recorded_response(tmp_path):
+    path = tmp_path / "road_network.npz"
+    network = RoadNetwork.load_or_ingest(path, bbox=None, overpass_json=FIXTURE)
+    assert path.exists()
+    assert RoadNetwork.load_or_ingest(path, bbox=None).stats() == network.stats()
+
+
+@pytest.mark.parametrize("target", [150, 300, 600])
+def test_routes_hit_target_length(grid, target):
+    sampler = RouteSampler(grid, seed=0)
+    routes = sampler.sample(50, target, tolerance=0.1)
+
+    assert len(routes) == 50
+    for route in routes:
+        assert target * 0.9 <= route.length <= target + 1e-6
+        assert LineString(route.lonlat).is_simple
+        #no junction visited twice
+        keys = grid._keys(route.lonlat)
+        assert len(np.unique(keys)) == len(keys)
+
+
+def test_route_road_length(grid):
+    route = RouteSampler(grid, seed=1).sample(1, 300)[0]
+    road = route.to_road(interpolate=False)
+    assert road.line_string.length == pytest.approx(route.length, rel=1e-3)
+    assert np.all(road.points[:, 2] == 1)
+
+
+def test_same_seed_same_routes(grid):
+    a = RouteSampler(grid, seed=7).sample(10, 300)
+    b = RouteSampler(grid, seed=7).sample(10, 300)
+    assert [r.name for r in a] == [r.name for r in b]
+
+
+def test_curvature_filter(grid):
+    #on a grid a route with no turn is the only straight one
+    sampler = RouteSampler(grid, seed=0)
+    routes = sampler.sample(10, 300, curvature=(0.0, 1e-6))
+
+    assert len(routes) == 10
+    assert sampler.stats()['off_curvature'] > 0
+    curvature = road_features([r.points()[:, 0:2] for r in routes])[:, FEATURE_NAMES.index('mean_curvature')]
+    assert np.all(curvature < 1e-6)
+    assert all(len(r.streets) == 1 for r in routes)
+
+
+def test_too_long_target_gives_up(grid):
+    sampler = RouteSampler(grid, seed=0)
+    assert sampler.sample(3, 100000) == []
+    assert sampler.stats()['dead_ends'] > 0
+
+
+def test_empty_network():
+    network = RoadNetwork([], [])
+    assert network.stats()['edges'] == 0
+    assert RouteSampler(network).sample(5, 300) == []
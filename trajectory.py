@@ -0,0 +1,133 @@
+import json
+import os
+import uuid
+from pathlib import Path
+import numpy as np
+
+
+class TrajectoryColumn:
+    '''
+        Fixed dtype, array backed per tick series, e.g. car positions.
+        Preallocated and grown by doubling, so appending a tick never copies
+        the whole series. Supports append, len, iteration and np.asarray like a list.
+    '''
+
+    def __init__(self, dtype, shape=(), capacity=0) -> None:
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self._data = np.empty((capacity,) + self.shape, dtype=self.dtype)
+        self._n = 0
+
+    def reserve(self, capacity: int):
+        if capacity <= len(self._data):
+            return
+        data = np.empty((capacity,) + self.shape, dtype=self.dtype)
+        data[:self._n] = self._data[:self._n]
+        self._data = data
+
+    def append(self, value):
+        if self._n == len(self._data):
+            self.reserve(max(16, 2 * len(self._data)))
+        self._data[self._n] = value
+        self._n += 1
+
+    @property
+    def array(self) -> np.ndarray:
+        return self._data[:self._n]
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __getitem__(self, i):
+        return self.array[i]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.array if dtype is None else self.array.astype(dtype)
+
+    def tolist(self):
+        return self.array.tolist()
+
+
+#per tick series stored in the binary file, with dtype and shape of one tick
+TRAJECTORY_COLUMNS = {
+    'out_of_bounds': (np.float32, ()),
+    'bbox': (np.float32, (4, 3)),
+    'position': (np.float32, (3,)),
+    'velocity': (np.float32, (3,)),
+    'goal_distance': (np.float32, ()),
+}
+#other large arrays stored next to them
+ARRAY_FIELDS = ['points']
+
+
+def trajectory_columns(capacity=0) -> dict:
+    return {name: TrajectoryColumn(dtype, shape, capacity)
+            for name, (dtype, shape) in TRAJECTORY_COLUMNS.items()}
+
+
+def unique_execution_path(dir: Path, name: str) -> Path:
+    '''Unique json path without probing the directory'''
+    return Path(dir) / f"{name}-{uuid.uuid4().hex[:12]}.json"
+
+
+def write_execution_data(json_path: Path, execution_data: dict):
+    '''
+        Writes small json metadata header and compressed .npz with arrays,
+        both with the same name, the header refers to the .npz file.
+    '''
+    json_path = Path(json_path)
+    npz_path = json_path.with_suffix(".npz")
+
+    arrays = {}
+    header = {}
+    for key, value in execution_data.items():
+        if key in TRAJECTORY_COLUMNS:
+            dtype, shape = TRAJECTORY_COLUMNS[key]
+            arrays[key] = np.asarray(value, dtype=dtype).reshape((-1,) + shape)
+        elif key in ARRAY_FIELDS:
+            arrays[key] = np.asarray(value, dtype=np.float64)
+        else:
+            header[key] = value
+    header['trajectory'] = npz_path.name
+
+    #write to temporary files first, a half written result is never picked up
+    tmp_npz = npz_path.with_suffix(".tmp.npz")
+    with open(tmp_npz, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_npz, npz_path)
+
+    tmp_json = json_path.with_suffix(".tmp")
+    with open(tmp_json, "w") as f:
+        json.dump(header, f)
+    os.replace(tmp_json, json_path)
+
+
+def load_execution_data(json_path: Path, columns=None) -> dict:
+    '''
+        Loads execution data as dict with arrays, columns limits which arrays are read.
+        Old results with everything in one json file are loaded as well.
+    '''
+    json_path = Path(json_path)
+    with open(json_path, "r") as f:
+        execution_data = json.load(f)
+
+    trajectory = execution_data.pop('trajectory', None)
+    if trajectory is None:
+        #legacy result, lists inside json
+        for key, (dtype, shape) in TRAJECTORY_COLUMNS.items():
+            if key in execution_data:
+                execution_data[key] = np.asarray(execution_data[key], dtype=dtype).reshape((-1,) + shape)
+        return execution_data
+
+    with np.load(json_path.parent / trajectory) as arrays:
+        for key in arrays.files:
+            if columns is None or key in columns:
+                execution_data[key] = arrays[key]
+    return execution_data
+
+
+if __name__ == "__main__":
+    print(f"File {__file__} is not meant to run as main")